@@ -0,0 +1,12 @@
+#!/bin/bash
+set -e
+
+# cd to project root directory
+cd "$(dirname "$(dirname "$0")")"
+docker build -t test .
+
+# times short runs inside the image against the bundled chrM genome; arguments are passed to app.benchmark.startup
+g=$(mktemp -d)
+trap "rm -rf $g" EXIT
+tar zfx src/test/resources/hg38-chrM.tar.gz --directory $g
+docker run --env RGTDATA=/rgtdata --volume $g:/rgtdata/hg38-chrM --workdir / test python3 -m app.benchmark.startup "$@"
@@ -8,3 +8,6 @@ docker build -t test .
 # change to package directory, run tests
 cd src
 python3 -m unittest test.test_app
+
+# unit tests run inside the image, where the package's dependencies are installed
+docker run --workdir / test python3 -m unittest app.test.test_kmers app.test.test_aggregate app.test.test_sequence app.test.test_filter app.test.test_signal app.test.test_footprint app.test.test_benchmark app.test.test_metrics app.test.test_estimate app.test.test_genome
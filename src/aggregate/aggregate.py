@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import numpy
+
+AGGREGATE_BLOCK_SIZE = 1024
+
+class Aggregator:
+
+    # per-key running sums, counts and moments over forward/reverse profiles; regions are buffered into a
+    # fixed-size float32 block, like the profiles themselves, and each block is folded into the float64 running
+    # moments with one vectorized pass
+
+    def __init__(self, ext_size: int = 500, block_size: int = AGGREGATE_BLOCK_SIZE):
+        self.width = ext_size * 2
+        self.keys = { "all": 0 }
+        self.count = numpy.zeros(1, dtype = numpy.int64)
+        self.sum = numpy.zeros((1, 2, self.width))
+        self.mean = numpy.zeros((1, 2, self.width))
+        self.m2 = numpy.zeros((1, 2, self.width))
+        self.block = numpy.empty((block_size, 2, self.width), dtype = numpy.float32)
+        self.blockKeys = numpy.empty(block_size, dtype = numpy.int64)
+        self.n = 0
+
+    def index(self, key) -> int:
+        if key not in self.keys:
+            self.keys[key] = len(self.keys)
+            if len(self.keys) > len(self.count):
+                grow = lambda x: numpy.concatenate([ x, numpy.zeros_like(x) ])
+                self.count, self.sum, self.mean, self.m2 = grow(self.count), grow(self.sum), grow(self.mean), grow(self.m2)
+        return self.keys[key]
+
+    def add(self, key, forward, reverse):
+        # windows clipped at a chromosome end are shorter; like the original list sums they only
+        # contribute to their leading positions
+        if len(forward) != self.width or len(reverse) != self.width: self.block[self.n] = 0
+        self.block[self.n, 0, :len(forward)] = forward
+        self.block[self.n, 1, :len(reverse)] = reverse
+        self.blockKeys[self.n] = self.index(key)
+        self.n += 1
+        if self.n == len(self.block): self.flush()
+
+    def flush(self):
+        if self.n > 0:
+            self.fold(self.blockKeys[:self.n], self.block[:self.n])
+            self.n = 0
+
+    def fold(self, idx, values):
+        if len(idx) == 0: return
+        order = numpy.argsort(idx, kind = "stable")
+        idx = idx[order]; values = values[order].astype(numpy.float64, copy = False)
+
+        # every region counts towards "all", so its row takes the moments of the whole block
+        keys = numpy.zeros(1, dtype = numpy.int64)
+        n = numpy.array([ len(idx) ])
+        sums = numpy.add.reduce(values, axis = 0)[None]
+        means = sums / n[:, None, None]
+        m2 = numpy.add.reduce((values - means[0]) ** 2, axis = 0)[None]
+
+        # the other keys, skipping regions of a key named "all", which share its row
+        other = numpy.searchsorted(idx, 1)
+        if other < len(idx):
+            idx = idx[other:]; values = values[other:]
+            starts = numpy.flatnonzero(numpy.r_[ True, idx[1:] != idx[:-1] ])
+            counts = numpy.diff(numpy.r_[ starts, len(idx) ])
+            blockSums = numpy.add.reduceat(values, starts, axis = 0)
+            blockMeans = blockSums / counts[:, None, None]
+            keys = numpy.r_[ keys, idx[starts] ]
+            n = numpy.r_[ n, counts ]
+            sums = numpy.concatenate([ sums, blockSums ])
+            means = numpy.concatenate([ means, blockMeans ])
+            m2 = numpy.concatenate([ m2, numpy.add.reduceat((values - numpy.repeat(blockMeans, counts, axis = 0)) ** 2, starts, axis = 0) ])
+
+        # combine block moments with the running moments (Chan et al.)
+        total = self.count[keys] + n
+        delta = means - self.mean[keys]
+        self.mean[keys] += delta * (n / total)[:, None, None]
+        self.m2[keys] += m2 + delta ** 2 * (self.count[keys] * n / total)[:, None, None]
+        self.sum[keys] += sums
+        self.count[keys] = total
+
+    def results(self):
+        self.flush()
+        results = {}
+        for k, i in self.keys.items():
+            n = int(self.count[i])
+            variance = numpy.maximum(self.m2[i], 0) / (n - 1) if n > 1 else numpy.zeros_like(self.m2[i])
+            results[k] = {
+                "forward": self.sum[i, 0].tolist(),
+                "reverse": self.sum[i, 1].tolist(),
+                "count": n,
+                "mean": { "forward": self.mean[i, 0].tolist(), "reverse": self.mean[i, 1].tolist() },
+                "variance": { "forward": variance[0].tolist(), "reverse": variance[1].tolist() }
+            }
+        return results
+
+def aggregate(signal, key = lambda x: "all", ext_size = 500):
+    aggregator = Aggregator(ext_size)
+    for x in signal:
+        if x["forward"] is not None and x["reverse"] is not None:
+            aggregator.add(key(x), x["forward"], x["reverse"])
+    return aggregator.results()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import tempfile
+
+from argparse import ArgumentParser
+from itertools import cycle, islice
+
+from .synthetic import SYNTHETIC_ASSEMBLY, chromosomeSizes, writeRgtData, occurrences, writeFimo, writeBam
+
+# throughput of the region filter, footprint(), aggregate() and the output writers on synthetic data, with no
+# Docker, network access or RGT data needed; from the repository root:
+#   python3 -m src.benchmark.benchmark --regions 100000 --output-file benchmark.json
+
+def args(argv):
+    parser = ArgumentParser(prog = "benchmark", description = "times each stage of the pipeline on a synthetic genome, BAM and FIMO file")
+    parser.add_argument("--regions", type = int, default = 1000, help = "number of FIMO occurrences to generate; default is 1000")
+    parser.add_argument("--motifs", type = int, default = 10, help = "number of distinct motifs; default is 10")
+    parser.add_argument("--duplicates", type = float, default = 0.1, help = "fraction of occurrences repeating earlier coordinates; default is 0.1")
+    parser.add_argument("--occurrence-threshold", type = float, default = 0.005, help = "q-value threshold; q-values are uniform on [0, 0.01], default is 0.005")
+    parser.add_argument("--chromosomes", type = int, default = 4, help = "number of chromosomes; default is 4")
+    parser.add_argument("--genome-size", type = int, default = None, help = "total genome length; default is 300 bp per region, at least 1 Mbp")
+    parser.add_argument("--reads-per-region", type = int, default = 20, help = "reads generated per occurrence, half of them around it; default is 20")
+    parser.add_argument("--ext-size", type = int, default = 500, help = "expands regions by the given number of basepairs around their centers")
+    parser.add_argument("--threads", "--workers", dest = "threads", type = int, default = 1, help = "worker processes for footprint(); default is 1")
+    parser.add_argument("--cut-site-cache", action = "store_true", default = False, help = "if set, runs footprint() with the cut-site cache")
+    parser.add_argument("--sample", type = int, default = 1000, help = "profiles kept from footprint() and replayed into the aggregate and output phases; default is 1000")
+    parser.add_argument("--seed", type = int, default = 0, help = "random seed for the synthetic data; default is 0")
+    parser.add_argument("--workdir", type = str, default = None, help = "if set, writes the synthetic data here and keeps it; default is a temporary directory")
+    parser.add_argument("--output-file", type = str, default = None, help = "path to write JSON results; default is stdout")
+    return parser.parse_args(argv)
+
+def peakRss():
+    # peak resident set size in MB of this process and of its largest finished child (e.g. a pool worker)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+def phase(results: dict, name: str, f):
+    # f returns the number of regions it processed
+    start = time.perf_counter()
+    n = f()
+    seconds = time.perf_counter() - start
+    rss, children = peakRss()
+    results[name] = {
+        "seconds": seconds,
+        "regions": n,
+        "regions_per_second": n / seconds if seconds > 0 else None,
+        "seconds_per_region": seconds / n if n > 0 else None,
+        "peak_rss_mb": rss,
+        "peak_children_rss_mb": children
+    }
+    print("INFO: %s: %d regions in %.3fs" % (name, n, seconds), file = sys.stderr)
+
+def replay(sample, n: int):
+    # n profiles cycling through the sample, so later phases see full-scale input without holding it
+    return islice(cycle(sample), n) if len(sample) > 0 else iter([])
+
+def run(cArgs, d: str):
+    from ..regions.filter import FilteredRegions
+    from ..footprint.footprint import footprint
+    from ..aggregate.aggregate import aggregate
+    from ..output.stream import RegionWriter, STREAM_FORMATS
+    from ..output.matrix import MatrixWriter, MATRIX_FORMATS
+
+    results = {}
+    sizes = chromosomeSizes(cArgs.genome_size if cArgs.genome_size is not None else max(1000000, cArgs.regions * 300), cArgs.chromosomes)
+    paths = { x: os.path.join(d, x) for x in [ "rgtdata", "fimo.txt", "reads.bam" ] }
+
+    def generate():
+        paths["genome"] = writeRgtData(paths["rgtdata"], sizes, cArgs.seed)
+        x = list(occurrences(sizes, cArgs.regions, cArgs.motifs, cArgs.duplicates, cArgs.ext_size * 2, cArgs.seed))
+        writeFimo(paths["fimo.txt"], x)
+        writeBam(paths["reads.bam"], sizes, [ (y[1], (y[2] + y[3]) // 2) for y in x ], cArgs.reads_per_region, seed = cArgs.seed)
+        return len(x)
+    phase(results, "generate", generate)
+    os.environ["RGTDATA"] = paths["rgtdata"]
+
+    regions = []
+    def filtered():
+        regions.extend(FilteredRegions(
+            paths["fimo.txt"], cArgs.occurrence_threshold, paths["genome"], os.path.join(paths["rgtdata"], SYNTHETIC_ASSEMBLY, "chrom.sizes.%s" % SYNTHETIC_ASSEMBLY)
+        ))
+        return len(regions)
+    phase(results, "filter", filtered)
+
+    sample = []
+    def signal():
+        n = 0
+        for x in footprint(paths["reads.bam"], regions, SYNTHETIC_ASSEMBLY, cArgs.ext_size, threads = cArgs.threads, sweep = cArgs.cut_site_cache):
+            if len(sample) < cArgs.sample: sample.append(x)
+            n += 1
+        return n
+    phase(results, "footprint", signal)
+    n = results["footprint"]["regions"]
+
+    def aggregated():
+        aggregate(replay(sample, n), lambda x: x["name"], cArgs.ext_size)
+        return n
+    phase(results, "aggregate", aggregated)
+
+    for format in STREAM_FORMATS:
+        def stream():
+            with open(os.path.join(d, "output." + format), 'w') as o, RegionWriter(o, format) as w:
+                for x in replay(sample, n): w.write(x)
+            return n
+        phase(results, "write_" + format, stream)
+    for format in MATRIX_FORMATS:
+        def matrix():
+            with MatrixWriter(os.path.join(d, "output." + format), cArgs.ext_size * 2, format) as w:
+                for x in replay(sample, n): w.write(x)
+            return n
+        try:
+            phase(results, "write_" + format, matrix)
+        except ImportError as e:
+            print("WARNING: skipping %s output: %s" % (format, e), file = sys.stderr)
+    return results
+
+def main(argv = None):
+    cArgs = args(argv)
+    # run() points RGTDATA at the synthetic data
+    environment = os.environ.get("RGTDATA")
+    try:
+        if cArgs.workdir is not None:
+            os.makedirs(cArgs.workdir, exist_ok = True)
+            results = run(cArgs, cArgs.workdir)
+        else:
+            with tempfile.TemporaryDirectory() as d:
+                results = run(cArgs, d)
+    finally:
+        if environment is not None: os.environ["RGTDATA"] = environment
+        else: os.environ.pop("RGTDATA", None)
+    report = { "parameters": vars(cArgs), "python": platform.python_version(), "platform": platform.platform(), "phases": results }
+    if cArgs.output_file is not None:
+        with open(cArgs.output_file, 'w') as o:
+            json.dump(report, o, indent = 2)
+    else:
+        print(json.dumps(report, indent = 2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+from argparse import ArgumentParser
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+RESOURCES = os.path.join(PACKAGE, "test", "resources")
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.benchmark.startup", description = "times short command-line runs, which are dominated by interpreter start-up and imports")
+    parser.add_argument("--assembly", type = str, default = "hg38-chrM", help = "genomic assembly to use; default is the bundled hg38-chrM")
+    parser.add_argument("--bam", type = str, default = os.path.join(RESOURCES, "test.bam"), help = "path to alignments in BAM format")
+    parser.add_argument("--bed", type = str, default = os.path.join(RESOURCES, "test.bed"), help = "path to a small set of regions")
+    parser.add_argument("--repeat", type = int, default = 5, help = "number of runs per case; default is 5")
+    return parser.parse_args(argv)
+
+def cases(cArgs, d: str):
+    run = [ "--bam", cArgs.bam, "--bed", cArgs.bed, "--assembly", cArgs.assembly ]
+    return {
+        "help": [ "--help" ],
+        "bed": run,
+        "aggregate": run + [ "--aggregate" ],
+        "plot": run + [ "--plot-output", os.path.join(d, "startup.png") ]
+    }
+
+def timeRun(argv, repeat: int):
+    # wall-clock seconds of complete `python3 -m <package>.main` processes
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [ sys.executable, "-m", os.path.basename(PACKAGE) + ".main" ] + argv,
+            cwd = os.path.dirname(PACKAGE), stdout = subprocess.DEVNULL, stderr = subprocess.PIPE
+        )
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError("%s failed: %s" % (' '.join(argv), result.stderr.decode().strip()))
+    return times
+
+def main(argv = None):
+    cArgs = args(argv)
+    results = {}
+    with tempfile.TemporaryDirectory() as d:
+        for name, argv in cases(cArgs, d).items():
+            times = timeRun(argv, cArgs.repeat)
+            results[name] = { "min": min(times), "median": statistics.median(times), "runs": times }
+            print("INFO: %s: median %.3fs" % (name, results[name]["median"]), file = sys.stderr)
+    print(json.dumps(results, indent = 2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import numpy
+
+from pysam import AlignmentFile, AlignedSegment, faidx, index
+
+# synthetic inputs for benchmarks: a random genome, an RGTDATA directory describing it with random k-mer bias
+# tables, FIMO occurrences on it and a coordinate-sorted BAM whose reads pile up around the occurrences
+
+SYNTHETIC_ASSEMBLY = "synthetic"
+BASES = numpy.frombuffer(b"ACGT", dtype = numpy.uint8)
+MOTIF_LENGTH = 15
+BIAS_TABLES = [ "SH", "DH", "ATAC" ]
+
+def chromosomeSizes(genome_size: int, chromosomes: int):
+    return { "chr%d" % (i + 1): genome_size // chromosomes for i in range(chromosomes) }
+
+def writeGenome(path: str, sizes: dict, seed: int = 0, line_length: int = 60, block_lines: int = 100000):
+    # uniformly random bases, generated and written a block of lines at a time
+    rng = numpy.random.default_rng(seed)
+    with open(path, 'wb') as o:
+        for chromosome, length in sizes.items():
+            o.write(b">%s\n" % chromosome.encode())
+            for i in range(0, length, line_length * block_lines):
+                n = min(line_length * block_lines, length - i)
+                rows = n // line_length
+                lines = numpy.full((rows, line_length + 1), ord('\n'), dtype = numpy.uint8)
+                lines[:, :line_length] = BASES[rng.integers(0, 4, rows * line_length, dtype = numpy.uint8)].reshape(rows, line_length)
+                o.write(lines.tobytes())
+                if n > rows * line_length:
+                    o.write(BASES[rng.integers(0, 4, n - rows * line_length, dtype = numpy.uint8)].tobytes() + b"\n")
+    faidx(path)
+
+def writeChromosomeSizes(path: str, sizes: dict):
+    with open(path, 'w') as o:
+        for chromosome, length in sizes.items():
+            o.write("%s\t%d\n" % (chromosome, length))
+
+def writeBiasTable(path: str, k: int = 8, seed: int = 0):
+    # log-normal bias around 1 for every k-mer
+    rng = numpy.random.default_rng(seed)
+    codes = numpy.arange(4 ** k)
+    kmers = [ ''.join([ "ACGT"[(x >> (2 * (k - 1 - j))) & 3] for j in range(k) ]) for x in codes.tolist() ]
+    with open(path, 'w') as o:
+        for kmer, value in zip(kmers, rng.lognormal(0, 0.5, 4 ** k).tolist()):
+            o.write("%s\t%f\n" % (kmer, value))
+
+def writeRgtData(root: str, sizes: dict, seed: int = 0, k: int = 8):
+    # an RGTDATA directory with a genome section for SYNTHETIC_ASSEMBLY and the bias tables of every protocol;
+    # returns the path to the genome FASTA
+    os.makedirs(os.path.join(root, SYNTHETIC_ASSEMBLY), exist_ok = True)
+    os.makedirs(os.path.join(root, "fp_hmms"), exist_ok = True)
+    genome = os.path.join(root, SYNTHETIC_ASSEMBLY, "genome_%s.fa" % SYNTHETIC_ASSEMBLY)
+    writeGenome(genome, sizes, seed)
+    writeChromosomeSizes(os.path.join(root, SYNTHETIC_ASSEMBLY, "chrom.sizes.%s" % SYNTHETIC_ASSEMBLY), sizes)
+    writeBiasTable(os.path.join(root, "fp_hmms", "bias_table_F.txt"), k, seed + 1)
+    writeBiasTable(os.path.join(root, "fp_hmms", "bias_table_R.txt"), k, seed + 2)
+    with open(os.path.join(root, "data.config"), 'w') as o:
+        o.write("[%s]\n" % SYNTHETIC_ASSEMBLY)
+        o.write("genome: {a}/genome_{a}.fa\nchromosome_sizes: {a}/chrom.sizes.{a}\n".format(a = SYNTHETIC_ASSEMBLY))
+        for x in [ "gene_regions", "annotation", "gene_alias" ]:
+            o.write("%s: %s/%s\n" % (x, SYNTHETIC_ASSEMBLY, x))
+        o.write("\n[HmmData]\n")
+        for x in [ "dnase", "dnase_bc", "atac_paired", "atac_single", "histone", "dnase_histone", "dnase_histone_bc", "atac_histone", "atac_histone_bc" ]:
+            o.write("default_hmm_%s: fp_hmms/%s.hmm\n" % (x, x))
+        for x in BIAS_TABLES:
+            o.write("default_bias_table_F_%s: fp_hmms/bias_table_F.txt\ndefault_bias_table_R_%s: fp_hmms/bias_table_R.txt\n" % (x, x))
+    open(os.path.join(root, "data.config.user"), 'w').close()
+    return genome
+
+def occurrences(sizes: dict, n: int, motifs: int = 10, duplicates: float = 0.1, margin: int = 1000, seed: int = 0):
+    # n (motif, chromosome, start, end, strand, q-value) tuples; a fraction of them repeat the coordinates of an
+    # earlier occurrence under another motif or on the other strand, as FIMO scans of motif databases do
+    rng = numpy.random.default_rng(seed)
+    names = list(sizes.keys())
+    chromosome = rng.integers(0, len(names), n)
+    start = rng.integers(margin, [ sizes[names[x]] - margin - MOTIF_LENGTH for x in chromosome.tolist() ])
+    motif = rng.integers(0, motifs, n)
+    strand = rng.integers(0, 2, n)
+    qvalue = rng.uniform(0, 0.01, n)
+    repeated = numpy.flatnonzero(rng.uniform(0, 1, n) < duplicates)
+    repeated = repeated[repeated > 0]
+    source = rng.integers(0, repeated, len(repeated)) if len(repeated) > 0 else repeated
+    chromosome[repeated] = chromosome[source]
+    start[repeated] = start[source]
+    for i in range(n):
+        yield "MOTIF%d" % motif[i], names[chromosome[i]], int(start[i]), int(start[i]) + MOTIF_LENGTH, "+-"[strand[i]], float(qvalue[i])
+
+def writeFimo(path: str, occurrences):
+    with open(path, 'w') as o:
+        o.write("#pattern name\tsequence name\tstart\tstop\tstrand\tq-value\n")
+        for x in occurrences:
+            o.write("%s\t%s\t%d\t%d\t%s\t%g\n" % x)
+
+def writeBam(path: str, sizes: dict, centers, reads_per_center: int = 20, background: float = 0.5, read_length: int = 50, seed: int = 0):
+    # single-end reads, half of them (by default) spread uniformly and the rest around the given
+    # (chromosome, position) centers; written coordinate-sorted and indexed
+    rng = numpy.random.default_rng(seed)
+    names = list(sizes.keys())
+    centers = list(centers)
+    positions = { x: [] for x in names }
+    for chromosome, position in centers:
+        positions[chromosome].append(position)
+    total = len(centers) * reads_per_center
+    local_reads = int(reads_per_center * (1 - background))
+    header = { "HD": { "VN": "1.0", "SO": "coordinate" }, "SQ": [ { "SN": x, "LN": sizes[x] } for x in names ] }
+    with AlignmentFile(path, "wb", header = header) as o:
+        for i, chromosome in enumerate(names):
+            n_background = int(total * background * sizes[chromosome] / sum(sizes.values()))
+            local = numpy.array(positions[chromosome], dtype = numpy.int64)
+            starts = numpy.concatenate([
+                rng.integers(0, sizes[chromosome] - read_length, n_background),
+                (numpy.repeat(local, local_reads) + rng.normal(0, 100, len(local) * local_reads)).astype(numpy.int64)
+            ])
+            starts = numpy.sort(numpy.clip(starts, 0, sizes[chromosome] - read_length))
+            reverse = rng.integers(0, 2, len(starts))
+            for j, (start, strand) in enumerate(zip(starts.tolist(), reverse.tolist())):
+                read = AlignedSegment()
+                read.query_name = "r%d_%d" % (i, j)
+                read.flag = 16 if strand else 0
+                read.reference_id = i
+                read.reference_start = start
+                read.mapping_quality = 60
+                read.cigartuples = [ (0, read_length) ]
+                o.write(read)
+    index(path)
@@ -1,3 +1,19 @@
 FORWARD_SHIFT = 5
 REVERSE_SHIFT = -4
 SG_WINDOW_SIZE = 9
+REGION_CHUNK_SIZE = 500
+# chunks submitted to each pool worker ahead of the consumer
+CHUNKS_IN_FLIGHT = 2
+BIAS_WINDOW = 50
+CUT_CACHE_SPAN = 1000000
+TRACK_BLOCK_SIZE = 1000000
+SEQUENCE_BLOCK_SIZE = 1000000
+SEQUENCE_CACHE_BLOCKS = 256
+CUT_BLOCK_SIZE = 100000
+CUT_CACHE_BLOCKS = 256
+BATCH_CACHED_BAMS = 2
+ESTIMATION_FORWARD_SHIFT = 4
+ESTIMATION_REVERSE_SHIFT = -4
+ESTIMATION_MAX_DUPLICATES = 100
+ESTIMATION_SAMPLES = 10000
+ESTIMATION_WINDOW = 1000
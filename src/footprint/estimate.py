@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import sys
+import itertools
+import numpy
+
+from pysam import Fastafile, Samfile
+
+from .constants import *
+from .kmers import encode, kmerCodes
+from .sequence import SequenceCache
+
+# k-mer Tn5 cleavage bias estimated from a BAM the way rgt's Estimation.estimate_bias_kmer computes it: the
+# frequency of the k-mer at each cut site over the frequency of that k-mer in the regions, with a pseudocount
+# of 1. Reads are fetched once per region and k-mers are counted with bincount over 2-bit codes rather than
+# one sequence fetch and dict update per read
+
+PSEUDOCOUNT = 1.0
+# k-mer codes gathered before they are folded into the counts with one bincount
+PENDING_CODES = 1 << 22
+
+def sampleRegions(lengths: dict, n: int, size: int = ESTIMATION_WINDOW, seed: int = 0):
+    # n distinct windows of the given size drawn uniformly from a grid over the chromosomes, so they never
+    # overlap, in coordinate order
+    chromosomes = [ c for c, l in lengths.items() if l >= size ]
+    offsets = numpy.r_[ 0, numpy.cumsum([ lengths[c] // size for c in chromosomes ]) ].astype(numpy.int64)
+    picked = numpy.sort(numpy.random.default_rng(seed).choice(int(offsets[-1]), min(n, int(offsets[-1])), replace = False))
+    which = numpy.searchsorted(offsets, picked, side = "right") - 1
+    return [ (chromosomes[c], (i - int(offsets[c])) * size, (i - int(offsets[c]) + 1) * size) for c, i in zip(which.tolist(), picked.tolist()) ]
+
+def readStarts(bam, chromosome: str, start: int, end: int, k: int, forward_shift: int, reverse_shift: int):
+    # start of the k-mer around the cut site of each read and its strand, in fetch order; like rgt, reads are
+    # dropped once more than ESTIMATION_MAX_DUPLICATES consecutive reads share a k-mer start (PCR artifacts)
+    p1 = []; reverse = []
+    for read in bam.fetch(chromosome, start, end):
+        if read.is_unmapped: continue
+        p1.append(read.reference_end + reverse_shift + 1 if read.is_reverse else read.reference_start + forward_shift - 1)
+        reverse.append(read.is_reverse)
+    p1 = numpy.array(p1, dtype = numpy.int64) - k // 2
+    reverse = numpy.array(reverse, dtype = bool)
+    if len(p1) == 0: return p1, reverse
+    i = numpy.arange(len(p1))
+    first = numpy.maximum.accumulate(numpy.where(numpy.r_[ True, p1[1:] != p1[:-1] ], i, 0))
+    keep = i - first <= ESTIMATION_MAX_DUPLICATES
+    return p1[keep], reverse[keep]
+
+class KmerCounts:
+
+    # observed k-mers at forward and reverse cut sites and expected k-mers on both strands of the regions;
+    # codes of many regions are gathered and counted at once, as a bincount costs 4^k whatever its input
+
+    def __init__(self, k: int):
+        self.k = k
+        self.observed = numpy.zeros((2, 4 ** k), dtype = numpy.int64)
+        self.expected = numpy.zeros((2, 4 ** k), dtype = numpy.int64)
+        self.reads = numpy.zeros(2, dtype = numpy.int64)
+        self.kmers = 0
+        self.pending = { (x, strand): [] for x in [ "observed", "expected" ] for strand in range(2) }
+        self.n = 0
+
+    def gather(self, counts: str, strand: int, codes):
+        self.pending[(counts, strand)].append(codes)
+        self.n += len(codes)
+        if self.n >= PENDING_CODES: self.flush()
+
+    def flush(self):
+        for (counts, strand), codes in self.pending.items():
+            if len(codes) > 0: getattr(self, counts)[strand] += numpy.bincount(numpy.concatenate(codes), minlength = 4 ** self.k)
+            codes.clear()
+        self.n = 0
+
+    def add(self, bam, sequence: SequenceCache, chromosome: str, start: int, end: int, forward_shift: int, reverse_shift: int):
+        k = self.k
+        p1, reverse = readStarts(bam, chromosome, start, end, k, forward_shift, reverse_shift)
+        # rgt cannot fetch k-mers starting before the chromosome; k-mers running past its end, or containing
+        # anything other than A, C, G or T, count towards the number of reads but not towards any k-mer
+        p1, reverse = p1[p1 >= 0], reverse[p1 >= 0]
+        lo = max(min(start, int(p1.min()) if len(p1) > 0 else start), 0)
+        hi = max(end, int(p1.max()) + k if len(p1) > 0 else end)
+        codes = encode(sequence(chromosome, lo, hi))
+        fcodes, finvalid = kmerCodes(codes, k)
+        rcodes, rinvalid = kmerCodes(codes, k, reverse = True)
+        j = p1 - lo
+        for strand, kmers, invalid in [ (0, fcodes, finvalid), (1, rcodes, rinvalid) ]:
+            x = j[(reverse == bool(strand)) & (j < len(kmers))]
+            self.reads[strand] += int((reverse == bool(strand)).sum())
+            self.gather("observed", strand, kmers[x[~invalid[x]]])
+        if start < 0: return
+
+        # every k-mer of the region but the last on the forward strand, and every one but the first on the
+        # reverse strand, as rgt slices the region and its reverse complement
+        n = max(min(end, sequence.length(chromosome)) - start - k, 0)
+        self.kmers += n
+        for strand, kmers, invalid, offset in [ (0, fcodes, finvalid, start - lo), (1, rcodes, rinvalid, start - lo + 1) ]:
+            self.gather("expected", strand, kmers[offset:offset + n][~invalid[offset:offset + n]])
+
+    def table(self):
+        # bias of every k-mer in code order on each strand, rounded to 6 digits as rgt does; strands without
+        # reads get a bias of 1
+        self.flush()
+        if self.kmers == 0: raise ValueError("no k-mers found in the regions")
+        tables = []
+        for strand in range(2):
+            if self.reads[strand] == 0:
+                tables.append([ 1 ] * 4 ** self.k)
+                continue
+            ratio = ((self.observed[strand] + PSEUDOCOUNT) / self.reads[strand]) / ((self.expected[strand] + PSEUDOCOUNT) / self.kmers)
+            tables.append([ round(x, 6) for x in ratio.tolist() ])
+        return tables
+
+def estimateBias(bam: str, genome: str, regions, k: int = 8, forward_shift: int = ESTIMATION_FORWARD_SHIFT,
+                 reverse_shift: int = ESTIMATION_REVERSE_SHIFT):
+    # regions are (chromosome, start, end, ...) tuples; returns the forward and reverse tables as lists of
+    # biases in k-mer code order
+    counts = KmerCounts(k)
+    skipped = 0
+    with Samfile(bam, "rb") as b, Fastafile(genome) as f:
+        # contigs present in both the BAM and the genome, looked up once per region
+        references = set(b.references) & set(f.references)
+        sequence = SequenceCache(f)
+        for i, region in enumerate(regions):
+            chromosome, start, end = region[:3]
+            if chromosome not in references:
+                skipped += 1
+                continue
+            counts.add(b, sequence, chromosome, start, end, forward_shift, reverse_shift)
+            if i % 1000 == 0: print("INFO: counting k-mers in region %d" % i, file = sys.stderr)
+    if skipped > 0:
+        print("WARNING: skipped %d regions on contigs missing from the BAM or the genome" % skipped, file = sys.stderr)
+    print("INFO: counted %d forward and %d reverse cut sites against %d k-mers" % (counts.reads[0], counts.reads[1], counts.kmers), file = sys.stderr)
+    return counts.table()
+
+def writeTable(path: str, values, k: int):
+    # same layout as rgt's write_table: one k-mer and its bias per line, k-mers in lexicographic order
+    with open(path, 'w') as o:
+        for kmer, value in zip(itertools.product("ACGT", repeat = k), values):
+            o.write("%s\t%s\n" % (''.join(kmer), value))
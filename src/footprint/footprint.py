@@ -1,17 +1,24 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import argparse
 import math
+import numpy
 
+from collections import OrderedDict, deque
+from itertools import groupby, islice
+from multiprocessing import Pool
 from typing import List, Tuple
 from pysam import Fastafile, Samfile
 
-from rgt.Util import ErrorHandler, HmmData, GenomeData, OverlapType
-from rgt.HINT.signalProcessing import GenomicSignal
-from rgt.HINT.biasTable import BiasTable
-
 from .constants import *
+from .signal import atacSignal, normalizeSignal, slopeSignals, cutSites, CutSiteCache, CutSiteBlocks, sweepSpans
+from .sequence import SequenceCache
+from .tracks import buildTracks, trackBlock, SignalTracks
+from .kmers import KmerBias, loadTable, loadCachedTables, kmerLength
+from ..regions.bed import readRegions
+from ..metrics.metrics import metrics
 
 def expandRegion(chromosome, start, end, name = None, w = 500, strand = '.'):
     m = (math.ceil if strand == '-' else math.floor)((int(start) + int(end)) / 2)
@@ -29,65 +36,353 @@ def regionDict(k, forward, reverse):
         "strand": strand
     }
 
-def footprint(bam: str, bed: str, assembly: str = "hg38", w: int = 500, dnase: bool = False, bias_type = "SH"):
+# rgt is imported where it is used: rgt.Util costs a fraction of a second and the HINT signal stack, needed only
+# for DNase-seq, pulls in scipy.stats
 
-    # load HMM and bias parameters for ATAC-seq
-    g = GenomeData(organism = assembly)
+def loadBiasTable(dnase: bool = False, bias_type = "SH", tables = None):
+    # tables is an optional (forward, reverse) pair of paths to custom tables, e.g. written by estimate-bias,
+    # that replaces the RGT table of the protocol
+    if tables is not None:
+        return loadTable(*tables) if dnase else loadCachedTables(*tables)
+    from rgt.Util import HmmData
     hmm_data = HmmData()
     if dnase:
-        hmm_file = hmm_data.get_default_hmm_dnase_bc()
         if bias_type == 'SH':
             table_F = hmm_data.get_default_bias_table_F_SH()
             table_R = hmm_data.get_default_bias_table_R_SH()
-            bias_table = BiasTable().load_table(table_file_name_F = table_F, table_file_name_R = table_R)
+            return loadTable(table_F, table_R)
         elif bias_type == 'DH':
             table_F = hmm_data.get_default_bias_table_F_DH()
             table_R = hmm_data.get_default_bias_table_R_DH()
-            bias_table = BiasTable().load_table(table_file_name_F = table_F, table_file_name_R = table_R)
+            return loadTable(table_F, table_R)
     else:
-        hmm_file = hmm_data.get_default_hmm_atac_paired()
+        # ATAC-seq tables are only read through KmerBias and can come from the binary caches
         table_F = hmm_data.get_default_bias_table_F_ATAC()
         table_R = hmm_data.get_default_bias_table_R_ATAC()
-        bias_table = BiasTable().load_table(table_file_name_F = table_F, table_file_name_R = table_R)
-
-    # load reads from BAM
-    reads_file = GenomicSignal(bam)
-    reads_file.load_sg_coefs(SG_WINDOW_SIZE)
-
-    # open data and sequence
-    bam = Samfile(bam, "rb")
-    fasta = Fastafile(g.get_genome())
-
-    # load and expand regions
-    with open(bed, 'r') as f:
-        regions = [ expandRegion(
-            *tuple(line.strip().split()[:3]), line.strip().split()[3] if len(line.strip().split()) >= 4 else None, w,
-            line.strip().split()[4] if len(line.strip().split()) >= 5 else '.'
-        ) for line in f ]
-    
-    # load signal
-    forward = []; reverse = []; failed = 0
-    get_reads = reads_file.get_signal_atac if not dnase else reads_file.get_signal
-    for i, x in enumerate(regions):
-        try:
-            chromosome, start, end, _, strand = x
-            atac_norm_f, atac_slope_f, atac_norm_r, atac_slope_r = get_reads(
-                chromosome, start, end, 0, 0, FORWARD_SHIFT if not dnase else 0, REVERSE_SHIFT if not dnase else 0,
-                1000 if dnase else 150, 98, 98, bias_table, g.get_genome()
+        return loadCachedTables(table_F, table_R)
+
+def loadRegions(bed, w: int = 500):
+    # bed is a path to a (optionally gzip-compressed) BED file or an iterable of (chromosome, start, end, name, strand)
+    return [ expandRegion(chromosome, start, end, name, w, strand) for chromosome, start, end, name, strand in (
+        readRegions(bed) if isinstance(bed, str) else bed
+    ) ]
+
+def partitionRegions(regions, chunk_size: int = REGION_CHUNK_SIZE, by_coordinate: bool = False):
+    # group region indices by chromosome (sorted by coordinate within a chromosome if requested), then split
+    # each group into chunks so that large chromosomes are spread over several workers; chunks are ordered by
+    # their smallest index to keep merging back into BED order cheap
+    key = (lambda i: (regions[i][0], regions[i][1], i)) if by_coordinate else (lambda i: (regions[i][0], i))
+    indices = sorted(range(len(regions)), key = key)
+    chunks = []
+    for _, group in groupby(indices, key = lambda i: regions[i][0]):
+        group = list(group)
+        chunks += [ [ (i, regions[i]) for i in group[j:j + chunk_size] ] for j in range(0, len(group), chunk_size) ]
+    return sorted(chunks, key = lambda x: min([ i for i, _ in x ]))
+
+# per-process signal state; set once by initSignalWorker in each worker (or in the parent for serial runs)
+_worker = None
+
+# signal state of the BAMs most recently used by batch jobs in this process, see useSignalWorker
+_workers = OrderedDict()
+
+def initSignalWorker(bam: str, genome: str, dnase: bool, bias_table, tracks: str = None, sequence: SequenceCache = None):
+    global _worker
+    reads_file = None
+    if dnase:
+        from rgt.HINT.signalProcessing import GenomicSignal
+        reads_file = GenomicSignal(bam)
+        reads_file.load_sg_coefs(SG_WINDOW_SIZE)
+    sequence = sequence if sequence is not None else SequenceCache(Fastafile(genome))
+    bam_file = Samfile(bam, "rb")
+    _worker = {
+        "reads_file": reads_file,
+        "bam": bam_file,
+        "fasta": sequence.fasta,
+        "sequence": sequence,
+        "cut_sites": CutSiteBlocks(bam_file),
+        "genome": genome,
+        "dnase": dnase,
+        "bias_table": bias_table,
+        "kmer_bias": KmerBias(bias_table),
+        "tracks": SignalTracks(tracks, kmerLength(bias_table)) if tracks is not None and not dnase else None
+    }
+
+def useSignalWorker(bam: str, genome: str, dnase: bool, bias_table, tracks: str = None):
+    # selects the signal state for a BAM, reusing the handles and cut-site blocks left by earlier jobs on it;
+    # all BAMs share the genome sequence cache
+    global _worker
+    key = (bam, dnase, tracks)
+    if key in _workers:
+        _workers.move_to_end(key)
+    else:
+        initSignalWorker(bam, genome, dnase, bias_table, tracks, _worker["sequence"] if _worker is not None else None)
+        _workers[key] = _worker
+        if len(_workers) > BATCH_CACHED_BAMS: _workers.popitem(last = False)
+    _worker = _workers[key]
+
+def initPoolWorker(profiling: bool, profile_path: str, *args):
+    # pool workers collect metrics like their parent, dumping any cProfile stats to <profile_path>.<pid>
+    if profiling: metrics.enable("%s.%d" % (profile_path, os.getpid()) if profile_path is not None else None)
+    initSignalWorker(*args)
+
+def measuredChunk(job):
+    # runs a chunk function in a pool worker and hands back the metrics collected meanwhile
+    f, chunk = job
+    return f(chunk), metrics.drain()
+
+def boundedMap(pool, f, jobs, limit: int):
+    # pool.imap with at most limit jobs submitted but not yet consumed, so that workers cannot run ahead of a slow
+    # consumer and pile finished results up in the parent; results come back in job order
+    jobs = iter(jobs)
+    pending = deque([ pool.apply_async(f, (x,)) for x in islice(jobs, limit) ])
+    while len(pending) > 0:
+        result = pending.popleft().get()
+        pending.extend([ pool.apply_async(f, (x,)) for x in islice(jobs, 1) ])
+        yield result
+
+def mergedChunks(results):
+    for chunk, drained in results:
+        metrics.merge(drained)
+        yield chunk
+
+def fetchCutSites(chromosome: str, start: int, end: int):
+    return cutSites(_worker["bam"], chromosome, start, end)
+
+def regionSignal(region, counts = None):
+    # forward and reverse profiles of a window as read on the + strand, as read-only float32 arrays, or None and
+    # the cause of the failure; orientSignal applies the region's strand
+    try:
+        chromosome, start, end = region[:3]
+        if _worker["dnase"]:
+            with metrics.phase("dnase_signal"):
+                atac_norm_f, atac_slope_f, atac_norm_r, atac_slope_r = _worker["reads_file"].get_signal(
+                    chromosome, start, end, 0, 0, 0, 0, 1000, 98, 98, _worker["bias_table"], _worker["genome"]
+                )
+        elif _worker["tracks"] is not None and _worker["tracks"].covers(chromosome, start, end):
+            with metrics.phase("tracks"):
+                forward, reverse = _worker["tracks"](chromosome, start, end)
+            atac_norm_f, atac_norm_r = normalizeSignal(forward, reverse)
+        else:
+            atac_norm_f, atac_norm_r = atacSignal(
+                counts if counts is not None else fetchCutSites, _worker["sequence"], chromosome, start, end, _worker["kmer_bias"]
             )
-            atac_norm_f = [ float(x) for x in atac_norm_f ]
-            atac_norm_r = [ float(x) for x in atac_norm_r ]
-            if strand == '-':
-                atac_norm_f.reverse()
-                atac_norm_r.reverse()
-            forward.append(atac_norm_f if strand != '-' else atac_norm_r)
-            reverse.append(atac_norm_r if strand != '-' else atac_norm_f)
-            if i % 500 == 0: print("INFO: aggregating region %d of %d" % (i, len(regions)), file = sys.stderr)
-        except:
-            if len(forward) <= i: forward.append(None)
-            if len(reverse) <= i: reverse.append(None)
-            failed += 1
-    if failed > 0:
-        print("WARNING: failed to generate bias-corrected signal profiles for %d regions" % failed, file = sys.stderr)
-
-    return [ regionDict(regions[i], forward[i], reverse[i]) for i in range(len(regions)) if forward[i] is not None and reverse[i] is not None ]
+        forward, reverse = numpy.asarray(atac_norm_f, dtype = numpy.float32), numpy.asarray(atac_norm_r, dtype = numpy.float32)
+        forward.flags.writeable = False; reverse.flags.writeable = False
+        return forward, reverse
+    except Exception as e:
+        return None, "error:" + type(e).__name__
+
+def orientSignal(signal, strand: str):
+    # profiles for a region on the given strand; profiles are read-only, so regions sharing a window share them
+    # and the - strand gets reversed views rather than copies; failures are passed on as they are
+    forward, reverse = signal
+    if forward is None or strand != '-': return signal
+    return reverse[::-1], forward[::-1]
+
+def uniqueWindows(regions):
+    # distinct (chromosome, start, end) windows of the expanded regions in order of first use, and the window
+    # of each region; the same coordinates under several motifs or on both strands are computed once
+    windows = {}
+    index = [ windows.setdefault(x[:3], len(windows)) for x in regions ]
+    return list(windows.keys()), index
+
+def windowCause(window, references, lengths: dict, tracks = None, k: int = 8):
+    # why an ATAC-seq window is bound to fail, from the BAM's contigs and the genome's chromosome sizes alone, or
+    # None; each check mirrors a point where atacSignal would raise, so skipping these windows changes no output;
+    # k is the k-mer length of the bias table
+    chromosome, start, end = window[:3]
+    if start < 0: return "before_chromosome_start"
+    if tracks is not None and tracks.covers(chromosome, start, end): return None
+    if chromosome not in references: return "contig_missing_from_bam"
+    # windows this close to the chromosome start are not bias-corrected and never read sequence
+    if start - BIAS_WINDOW // 2 <= 0: return None
+    if chromosome not in lengths: return "contig_missing_from_genome"
+    # the sequence that biasCorrection fetches starts k // 2 bases before the smoothing window and stops at the
+    # chromosome end; it needs BIAS_WINDOW k-mers beyond the window
+    w = BIAS_WINDOW // 2
+    if start - w - k // 2 < 0: return "before_chromosome_start"
+    kmers = min(end + w + math.ceil(k / 2) - 1, lengths[chromosome]) - (start - w - k // 2) - k + 1
+    if kmers < 2 * w: return "past_chromosome_end"
+    return None
+
+def windowCauses(windows, bam: str, genome: str, dnase: bool, bias_table, tracks: str = None):
+    # doomed windows are never handed to workers; DNase-seq signal comes from rgt and is not checked
+    if dnase: return [ None ] * len(windows)
+    with Samfile(bam, "rb") as b, Fastafile(genome) as f:
+        references = set(b.references)
+        lengths = dict(zip(f.references, f.lengths))
+    t = SignalTracks(tracks, kmerLength(bias_table)) if tracks is not None else None
+    try:
+        return [ windowCause(x, references, lengths, t, kmerLength(bias_table)) for x in windows ]
+    finally:
+        if t is not None: t.close()
+
+def skippedSignals(causes, signals):
+    # signals yields results for the windows without a cause, in order; yields one result per window
+    signals = iter(signals)
+    for cause in causes:
+        yield (None, cause) if cause is not None else next(signals)
+
+def fanOut(regions, index, signals):
+    # signals yields one result per window in window order; yields one oriented result per region in BED order,
+    # holding each window's result only until its last region
+    last = {}
+    for i, j in enumerate(index): last[j] = i
+    held = {}; computed = 0
+    signals = iter(signals)
+    for i, j in enumerate(index):
+        while computed <= j:
+            held[computed] = next(signals)
+            computed += 1
+        yield orientSignal(held[j] if last[j] != i else held.pop(j), regions[i][4])
+
+def chunkSignals(chunk):
+    return [ (i, regionSignal(x)) for i, x in chunk ]
+
+def sweepSignals(chunk):
+    # chunk is sorted by coordinate; reads are fetched once per merged span and each region is sliced from it
+    results = []
+    for chromosome, start, end, members in sweepSpans(chunk):
+        try:
+            cache = CutSiteCache(_worker["bam"], chromosome, start, end)
+        except Exception as e:
+            results += [ (i, (None, "error:" + type(e).__name__)) for i, _ in members ]
+            continue
+        results += [ (i, regionSignal(x, cache)) for i, x in members ]
+    return results
+
+def trackBlockSignal(block):
+    return trackBlock(block, _worker["bam"], _worker["sequence"], _worker["kmer_bias"])
+
+def orderedSignals(chunks):
+    # chunks complete out of BED order; buffer them and release signals strictly by region index
+    pending = {}; current = 0
+    for chunk in chunks:
+        for i, x in chunk:
+            pending[i] = x
+        while current in pending:
+            yield pending.pop(current)
+            current += 1
+
+def regionDicts(regions, signals, rejected = None):
+    # pairs signals with their expanded regions, skipping failures and tallying them by cause; rejected is an
+    # optional open file to which failed regions are written as BED6 plus a cause column
+    failed = {}; empty = 0
+    for i, (forward, reverse) in enumerate(signals):
+        if forward is None:
+            failed[reverse] = failed.get(reverse, 0) + 1
+            if rejected is not None:
+                chromosome, start, end, name, strand = regions[i]
+                rejected.write("%s\t%d\t%d\t%s\t0\t%s\t%s\n" % (chromosome, start, end, name if name is not None else '.', strand, reverse))
+            continue
+        if not forward.any() and not reverse.any(): empty += 1
+        if i % 500 == 0: print("INFO: aggregating region %d of %d" % (i, len(regions)), file = sys.stderr)
+        yield regionDict(regions[i], forward, reverse)
+    metrics.count("regions", len(regions))
+    metrics.count("regions_failed", sum(failed.values()))
+    for cause, n in failed.items(): metrics.count("failures." + cause, n)
+    if empty > 0:
+        print("INFO: %d regions have no Tn5 insertions in their window" % empty, file = sys.stderr)
+    if len(failed) > 0:
+        print("WARNING: failed to generate bias-corrected signal profiles for %d regions (%s)" % (
+            sum(failed.values()), ", ".join([ "%s: %d" % x for x in sorted(failed.items()) ])
+        ), file = sys.stderr)
+
+def slopeDicts(dicts, window: int = SG_WINDOW_SIZE, batch_size: int = REGION_CHUNK_SIZE):
+    # adds "forward_slope" and "reverse_slope" profiles to each region, filtering a batch of regions at a time as
+    # one region x position matrix per strand; windows clipped at a chromosome end are batched by length
+    def slopes(batch):
+        lengths = {}
+        for i, x in enumerate(batch): lengths.setdefault(len(x["forward"]), []).append(i)
+        for indices in lengths.values():
+            f, r = slopeSignals([ batch[i]["forward"] for i in indices ], [ batch[i]["reverse"] for i in indices ], window)
+            f, r = f.astype(numpy.float32), r.astype(numpy.float32)
+            f.flags.writeable = False; r.flags.writeable = False
+            for j, i in enumerate(indices):
+                batch[i]["forward_slope"], batch[i]["reverse_slope"] = f[j], r[j]
+        return batch
+    batch = []
+    for x in dicts:
+        batch.append(x)
+        if len(batch) == batch_size:
+            yield from slopes(batch)
+            batch = []
+    if len(batch) > 0: yield from slopes(batch)
+
+def footprint(bam: str, bed, assembly: str = "hg38", w: int = 500, dnase: bool = False, bias_type = "SH", threads: int = 1,
+              sweep: bool = False, tracks: str = None, rejected = None, slope_window: int = None, bias_tables = None):
+
+    # load HMM and bias parameters for ATAC-seq
+    with metrics.phase("setup"):
+        from rgt.Util import GenomeData
+        g = GenomeData(organism = assembly)
+        bias_table = loadBiasTable(dnase, bias_type, bias_tables)
+    if sweep and dnase:
+        print("WARNING: cut-site caching is only available for ATAC-seq; computing DNase signal per region", file = sys.stderr)
+        sweep = False
+    if tracks is not None and dnase:
+        print("WARNING: precomputed tracks are only available for ATAC-seq; computing DNase signal per region", file = sys.stderr)
+
+    # load and expand regions, then compute each distinct window once
+    with metrics.phase("regions"):
+        regions = loadRegions(bed, w)
+        windows, index = uniqueWindows(regions)
+        causes = windowCauses(windows, bam, g.get_genome(), dnase, bias_table, tracks)
+        computed = [ x for x, cause in zip(windows, causes) if cause is None ]
+    metrics.count("windows", len(windows))
+    if len(windows) < len(regions):
+        print("INFO: computing %d distinct windows for %d regions" % (len(windows), len(regions)), file = sys.stderr)
+
+    # load signal; each worker opens its own BAM and FASTA handles once, and profiles are yielded in BED
+    # order as soon as they are available so that callers never need to hold all of them at once
+    pool = None
+    with metrics.phase("setup"):
+        if threads > 1:
+            pool = Pool(threads, initializer = initPoolWorker, initargs = (metrics.enabled, metrics.profile_path, bam, g.get_genome(), dnase, bias_table, tracks))
+            signals = orderedSignals(mergedChunks(boundedMap(pool, measuredChunk, [
+                (sweepSignals if sweep else chunkSignals, x) for x in partitionRegions(computed, by_coordinate = sweep)
+            ], threads * CHUNKS_IN_FLIGHT)))
+        elif sweep:
+            initSignalWorker(bam, g.get_genome(), dnase, bias_table, tracks)
+            signals = orderedSignals(map(sweepSignals, partitionRegions(computed, by_coordinate = True)))
+        else:
+            initSignalWorker(bam, g.get_genome(), dnase, bias_table, tracks)
+            signals = ( regionSignal(x) for x in computed )
+    try:
+        results = regionDicts(regions, fanOut(regions, index, skippedSignals(causes, signals)), rejected)
+        yield from slopeDicts(results, slope_window) if slope_window is not None else results
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def footprintJob(bam: str, bed, genome: str, bias_table, w: int = 500, dnase: bool = False, tracks: str = None, slope_window: int = None):
+    # serial footprint() for batch jobs, which share the bias table and genome loaded once by the caller; cut
+    # sites come from the per-BAM block cache so that jobs on the same BAM reuse each other's counts
+    useSignalWorker(bam, genome, dnase, bias_table, tracks)
+    regions = loadRegions(bed, w)
+    windows, index = uniqueWindows(regions)
+    if dnase:
+        causes = [ None ] * len(windows)
+    else:
+        references = set(_worker["bam"].references)
+        lengths = dict(zip(_worker["fasta"].references, _worker["fasta"].lengths))
+        causes = [ windowCause(x, references, lengths, _worker["tracks"], _worker["kmer_bias"].k) for x in windows ]
+    counts = _worker["cut_sites"] if not dnase else None
+    signals = ( regionSignal(x, counts) for x, cause in zip(windows, causes) if cause is None )
+    results = regionDicts(regions, fanOut(regions, index, skippedSignals(causes, signals)))
+    return slopeDicts(results, slope_window) if slope_window is not None else results
+
+def precompute(bam: str, prefix: str, assembly: str = "hg38", threads: int = 1, bias_tables = None):
+
+    # writes genome-wide per-strand bias-corrected ATAC-seq insertion tracks to <prefix>.forward.bw and
+    # <prefix>.reverse.bw for footprint(..., tracks = prefix)
+    from rgt.Util import GenomeData
+    g = GenomeData(organism = assembly)
+    bias_table = loadBiasTable(tables = bias_tables)
+    k = kmerLength(bias_table)
+    if threads > 1:
+        with Pool(threads, initializer = initSignalWorker, initargs = (bam, g.get_genome(), False, bias_table)) as pool:
+            buildTracks(bam, g.get_genome(), k, prefix, lambda blocks: boundedMap(pool, trackBlockSignal, blocks, threads * CHUNKS_IN_FLIGHT))
+    else:
+        initSignalWorker(bam, g.get_genome(), False, bias_table)
+        buildTracks(bam, g.get_genome(), k, prefix, lambda blocks: map(trackBlockSignal, blocks))
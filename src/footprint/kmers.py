@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import math
+import numpy
+import hashlib
+import tempfile
+
+# k-mer cleavage bias lookup; bias tables are converted once into dense arrays indexed by a 2-bit k-mer code
+# (A=0, C=1, G=2, T=3) so that the expected cuts for a whole window are a single gather instead of one string
+# slice and dict lookup per base and strand
+
+DEFAULT_KMER_VALUE = 1.0
+
+REVCOMP = str.maketrans("ACGTN", "TGCAN")
+NON_ACGTN = str.maketrans("", "", "ACGTN")
+
+ENCODING = numpy.full(256, 4, dtype = numpy.int64)
+ENCODING[numpy.frombuffer(b"ACGT", dtype = numpy.uint8)] = numpy.arange(4)
+
+def checkBases(sequence: str):
+    # raises KeyError on anything other than upper-case A, C, G, T and N, like rgt's AuxiliaryFunctions.revcomp
+    if sequence.translate(NON_ACGTN):
+        raise KeyError("unexpected character in sequence")
+
+def revcomp(sequence: str) -> str:
+    checkBases(sequence)
+    return sequence.translate(REVCOMP)[::-1]
+
+def encode(sequence: str):
+    # 2-bit codes, with 4 marking anything that is not an upper-case A, C, G or T
+    return ENCODING[numpy.frombuffer(sequence.encode("ascii", "replace"), dtype = numpy.uint8)]
+
+def kmerCodes(codes, k: int, reverse: bool = False):
+    # codes of every k-mer in an encoded sequence (of its reverse complement if requested), plus a mask of
+    # k-mers that contain a base outside ACGT
+    n = max(len(codes) - k + 1, 0)
+    index = numpy.zeros(n, dtype = numpy.int64)
+    invalid = numpy.zeros(n, dtype = bool)
+    for j in range(k):
+        c = codes[j:j + n]
+        invalid |= c == 4
+        index |= ((3 - c) & 3) << (2 * j) if reverse else (c & 3) << (2 * (k - 1 - j))
+    return index, invalid
+
+def denseTable(table: dict, k: int):
+    # returns None for tables that cannot be indexed by a 2-bit code (mixed lengths or non-ACGT k-mers)
+    dense = numpy.full(4 ** k, DEFAULT_KMER_VALUE, dtype = numpy.float64)
+    keys = list(table.keys())
+    if any([ len(x) != k for x in keys ]): return None
+    index, invalid = kmerCodes(encode(''.join(keys)), k)
+    index, invalid = index[::k], invalid[::k]
+    if invalid.any(): return None
+    dense[index] = list(table.values())
+    return dense
+
+def parseTable(lines):
+    # same parsing as rgt's BiasTable.load_table, which would otherwise pull in rgt's region and scipy.stats stack
+    table = {}
+    for line in lines:
+        x = line.strip().split('\t')
+        table[x[0]] = float(x[1])
+    return table
+
+def loadTable(table_F: str, table_R: str):
+    tables = []
+    for path in (table_F, table_R):
+        with open(path, 'r') as f:
+            tables.append(parseTable(f))
+    return tables
+
+class DenseTable:
+
+    # a bias table as a dense array indexed by k-mer code, memory-mapped from its binary cache when there is one;
+    # pickles as the cache path, so pool workers map the same pages instead of each receiving a copy
+
+    def __init__(self, path: str = None, values = None):
+        self.path = path
+        self.values = numpy.asarray(numpy.load(path, mmap_mode = 'r')) if values is None else values
+        self.k = int(round(math.log(len(self.values), 4)))
+
+    def __reduce__(self):
+        return (DenseTable, (self.path,)) if self.path is not None else (DenseTable, (None, self.values))
+
+def cachePath(path: str, checksum: str) -> str:
+    return "%s.%s.npy" % (path, checksum)
+
+def cachedTable(path: str):
+    # a DenseTable for a text bias table, converted once into <path>.<checksum>.npy next to it; a cache
+    # written for another version of the table has another checksum and is replaced. Tables that cannot
+    # be indexed densely are returned as dicts
+    with open(path, 'rb') as f:
+        data = f.read()
+    cache = cachePath(path, hashlib.sha1(data).hexdigest()[:16])
+    if os.path.exists(cache):
+        try:
+            return DenseTable(cache)
+        except (OSError, ValueError) as e:
+            print("WARNING: ignoring unreadable bias table cache %s: %s" % (cache, e), file = sys.stderr)
+    table = parseTable(data.decode().splitlines())
+    dense = denseTable(table, len(next(iter(table))))
+    if dense is None: return table
+    try:
+        with tempfile.NamedTemporaryFile(dir = os.path.dirname(os.path.abspath(path)), suffix = ".npy", delete = False) as o:
+            numpy.save(o, dense)
+        os.replace(o.name, cache)
+        for x in glob.glob(glob.escape(path) + ".*.npy"):
+            if x != cache: os.remove(x)
+    except OSError as e:
+        print("WARNING: unable to cache bias table %s: %s" % (path, e), file = sys.stderr)
+        return DenseTable(None, dense)
+    return DenseTable(cache)
+
+def loadCachedTables(table_F: str, table_R: str):
+    # dense tables from the binary caches if both tables can be indexed densely, otherwise dicts as loadTable
+    tables = [ cachedTable(table_F), cachedTable(table_R) ]
+    if all([ isinstance(x, DenseTable) for x in tables ]) and tables[0].k == tables[1].k: return tables
+    return loadTable(table_F, table_R)
+
+def kmerLength(bias_table) -> int:
+    return bias_table[0].k if isinstance(bias_table[0], DenseTable) else len(next(iter(bias_table[0])))
+
+class KmerBias:
+
+    def __init__(self, bias_table):
+        self.table = bias_table
+        self.k = kmerLength(bias_table)
+        if isinstance(bias_table[0], DenseTable):
+            self.forward, self.reverse = bias_table[0].values, bias_table[1].values
+        else:
+            self.forward = denseTable(bias_table[0], self.k)
+            self.reverse = denseTable(bias_table[1], self.k)
+
+    def lookup(self, sequence: str, k0: int, count: int, dense, reverse: bool):
+        # bias of the k-mers starting at k0 .. k0 + count - 1 of sequence; positions without a full k-mer
+        # inside the sequence get the default value, as a failed dict lookup does in rgt
+        values = numpy.full(count, DEFAULT_KMER_VALUE)
+        lo, hi = max(k0, 0), min(k0 + count, len(sequence) - self.k + 1)
+        if hi > lo:
+            index, invalid = kmerCodes(encode(sequence[lo:hi + self.k - 1]), self.k, reverse)
+            values[lo - k0:hi - k0] = numpy.where(invalid, DEFAULT_KMER_VALUE, dense[index])
+        return values
+
+    def __call__(self, sequence: str, rsequence: str):
+        # sequence spans [p1_wk, p2_wk - 1) and rsequence [p1_wk + 1, p2_wk), as fetched by rgt's
+        # bias_correction_atac; returns the forward and reverse bias at each window position. rgt reverse-complements
+        # rsequence, so it fails on the same unexpected bases
+        checkBases(rsequence)
+        if self.forward is None or self.reverse is None:
+            return self.dictLookup(sequence, rsequence)
+        k = self.k
+        count = max(len(sequence) - k + 1, 0)
+        start = math.ceil(k / 2) - k // 2
+        return (
+            self.lookup(sequence, start, count, self.forward, False),
+            self.lookup(rsequence, start + len(rsequence) - len(sequence), count, self.reverse, True)
+        )
+
+    def dictLookup(self, sequence: str, rsequence: str):
+        # rgt's per-position lookup, used for tables that are not dense over ACGT k-mers
+        fBias, rBias = self.table
+        k = self.k
+        rsequence = revcomp(rsequence)
+        lo, hi = math.ceil(k / 2), len(sequence) - k // 2 + 1
+        af = [ fBias.get(sequence[i - k // 2:i + math.ceil(k / 2)], DEFAULT_KMER_VALUE) for i in range(lo, hi) ]
+        ar = [ rBias.get(rsequence[len(sequence) - math.ceil(k / 2) - i:len(sequence) + k // 2 - i], DEFAULT_KMER_VALUE) for i in range(lo, hi) ]
+        return numpy.array(af, dtype = numpy.float64), numpy.array(ar, dtype = numpy.float64)
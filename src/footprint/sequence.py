@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict
+
+from .constants import *
+
+class SequenceCache:
+
+    # upper-case genome sequence served from fixed-size blocks of an already open FASTA handle, so that all
+    # regions on a chromosome share a handful of fetches; the least recently used blocks are dropped once
+    # more than max_blocks are held, which bounds memory on large genomes
+
+    def __init__(self, fasta, block_size: int = SEQUENCE_BLOCK_SIZE, max_blocks: int = SEQUENCE_CACHE_BLOCKS):
+        self.fasta = fasta
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.lengths = {}
+
+    def length(self, chromosome: str) -> int:
+        if chromosome not in self.lengths:
+            self.lengths[chromosome] = self.fasta.get_reference_length(chromosome)
+        return self.lengths[chromosome]
+
+    def block(self, chromosome: str, i: int) -> str:
+        key = (chromosome, i)
+        if key in self.blocks:
+            self.blocks.move_to_end(key)
+        else:
+            self.blocks[key] = str(self.fasta.fetch(chromosome, i * self.block_size, (i + 1) * self.block_size)).upper()
+            if len(self.blocks) > self.max_blocks: self.blocks.popitem(last = False)
+        return self.blocks[key]
+
+    def __call__(self, chromosome: str, start: int, end: int) -> str:
+        # same coordinates, clipping and errors as Fastafile.fetch(chromosome, start, end).upper()
+        if start < 0: raise ValueError("start out of range (%d)" % start)
+        if start > end: raise ValueError("invalid coordinates: start (%d) > stop (%d)" % (start, end))
+        end = min(end, self.length(chromosome))
+        if start >= end: return ""
+        size = self.block_size
+        return ''.join([
+            self.block(chromosome, i)[max(start - i * size, 0):end - i * size] for i in range(start // size, (end - 1) // size + 1)
+        ])
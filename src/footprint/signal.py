@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+import math
+import numpy
+
+from collections import OrderedDict
+
+from .constants import *
+from ..metrics.metrics import metrics
+
+# NumPy re-implementation of rgt's GenomicSignal.get_signal_atac that takes cut-site counts and sequence from
+# the caller instead of fetching them per region; every step reproduces rgt's arithmetic in the same order so
+# the normalized profiles are bit-for-bit identical
+
+def cutSites(bam, chromosome: str, start: int, end: int, forward_shift: int = FORWARD_SHIFT, reverse_shift: int = REVERSE_SHIFT):
+    # forward and reverse Tn5 insertion counts over [start, end) for reads overlapping the interval
+    forward = []; reverse = []
+    for read in bam.fetch(chromosome, start, end):
+        if read.is_unmapped: continue
+        if not read.is_reverse:
+            forward.append(read.reference_start + forward_shift)
+        else:
+            reverse.append(read.reference_end + reverse_shift - 1)
+    metrics.count("reads_fetched", len(forward) + len(reverse))
+    def count(x):
+        x = numpy.array(x, dtype = numpy.int64)
+        return numpy.bincount(x[(x >= start) & (x < end)] - start, minlength = end - start)
+    return count(forward), count(reverse)
+
+def windowSums(x, window: int):
+    x = numpy.r_[ 0, numpy.cumsum(x) ]
+    return (x[window:] - x[:-window]).astype(numpy.float64)
+
+def rollingSums(x, window: int):
+    # rgt keeps a running sum, starting from sum(x[:window]) and alternately subtracting the outgoing and
+    # adding the incoming value; accumulating the interleaved steps reproduces its rounding exactly
+    n = len(x) - 2 * (window // 2)
+    if n <= 0: return numpy.zeros(0)
+    steps = numpy.empty(2 * n - 1)
+    steps[0] = sum(x[:window].tolist())
+    steps[1::2] = -x[:n - 1]
+    steps[2::2] = x[window:window + n - 1]
+    return numpy.add.accumulate(steps)[::2]
+
+def biasCorrection(counts, sequence, chromosome: str, start: int, end: int, kmer_bias):
+    # counts(chromosome, start, end) -> forward/reverse cut-site counts; sequence(chromosome, start, end) -> upper-case
+    # bases; kmer_bias is a KmerBias over the bias table
+    k = kmer_bias.k
+    w = BIAS_WINDOW // 2
+    p1_w, p2_w = start - w, end + w
+    p1_wk, p2_wk = p1_w - k // 2, p2_w + math.ceil(k / 2)
+    if start <= 0 or p1_w <= 0 or p2_wk <= 0:
+        if start < 0: raise ValueError("start out of range (%d)" % start)
+        with metrics.phase("cut_sites"):
+            nf, nr = counts(chromosome, start, end)
+        return nf.astype(numpy.float64), nr.astype(numpy.float64)
+
+    # smoothed counts are integer-valued, so any summation order is exact
+    with metrics.phase("cut_sites"):
+        nf, nr = counts(chromosome, p1_w, p2_w)
+    Nf, Nr = windowSums(nf, BIAS_WINDOW), windowSums(nr, BIAS_WINDOW)
+
+    # expected cuts from the k-mer bias around each position; kmer_bias rejects unexpected bases in the second
+    # fetch, as rgt does
+    with metrics.phase("sequence"):
+        fseq = sequence(chromosome, p1_wk, p2_wk - 1)
+        rseq = sequence(chromosome, p1_wk + 1, p2_wk)
+    with metrics.phase("bias_lookup"):
+        af, ar = kmer_bias(fseq, rseq)
+    # near the chromosome end the sequence runs out before the BIAS_WINDOW k-mers around the window do
+    n = len(af) - 2 * w
+    if n < 0: raise ValueError("too few k-mers before the end of %s for bias correction" % chromosome)
+    with metrics.phase("bias_correction"):
+        fSum, rSum = rollingSums(af, BIAS_WINDOW), rollingSums(ar, BIAS_WINDOW)
+        return Nf[:n] * (af[w:w + n] / fSum), Nr[:n] * (ar[w:w + n] / rSum)
+
+def scoreAtPercentile(x, per: float):
+    # scipy.stats.scoreatpercentile with its default interpolation and the same arithmetic, so that results are
+    # identical without importing scipy.stats
+    if len(x) == 0: return numpy.nan
+    x = numpy.sort(x)
+    idx = per / 100. * (len(x) - 1)
+    i = int(idx)
+    if i == idx:
+        return numpy.add.reduce(x[i:i + 1] * numpy.array(1)) / 1.0
+    weights = numpy.array([ (i + 1 - idx), (idx - i) ], float)
+    return numpy.add.reduce(x[i:i + 2] * weights) / weights.sum()
+
+def boyleNorm(x):
+    positive = x[x > 0]
+    return x / positive.mean() if len(positive) > 0 else x
+
+def honNorm(x, mean, std):
+    if std == 0: return x
+    with numpy.errstate(over = "ignore"):
+        return numpy.where(x == 0, x, 1.0 / (1.0 + numpy.exp(-(x - mean) / std)))
+
+def normalizeSignal(forward, reverse, per_norm: int = 98):
+    with metrics.phase("normalize"):
+        forward, reverse = boyleNorm(numpy.asarray(forward)), boyleNorm(numpy.asarray(reverse))
+        return honNorm(forward, scoreAtPercentile(forward, per_norm), forward.std()), honNorm(reverse, scoreAtPercentile(reverse, per_norm), reverse.std())
+
+def atacSignal(counts, sequence, chromosome: str, start: int, end: int, kmer_bias, per_norm: int = 98):
+    return normalizeSignal(*biasCorrection(counts, sequence, chromosome, start, end, kmer_bias), per_norm)
+
+def rowPercentiles(x, per: float):
+    # scoreAtPercentile of each row of a matrix
+    if x.shape[1] == 0: return numpy.full(len(x), numpy.nan)
+    x = numpy.sort(x, axis = 1)
+    idx = per / 100. * (x.shape[1] - 1)
+    i = int(idx)
+    if i == idx: return x[:, i] / 1.0
+    weights = numpy.array([ (i + 1 - idx), (idx - i) ], float)
+    return (x[:, i:i + 2] * weights).sum(axis = 1) / weights.sum()
+
+def rowHonNorm(x, mean, std):
+    # honNorm of each row of a matrix with its own mean and std
+    with numpy.errstate(over = "ignore", divide = "ignore", invalid = "ignore"):
+        y = numpy.where(x == 0, x, 1.0 / (1.0 + numpy.exp(-(x - mean[:, None]) / std[:, None])))
+    return numpy.where((std == 0)[:, None], x, y)
+
+def sgCoefficients(window: int, order: int = 2, deriv: int = 1):
+    # rgt's savitzky_golay_coefficients: the reversed least-squares derivative weights over the window
+    half = (window - 1) // 2
+    b = numpy.array([ [ k ** i for i in range(order + 1) ] for k in range(-half, half + 1) ], float)
+    return numpy.linalg.pinv(b)[deriv][::-1]
+
+def slopeSignals(forward, reverse, window: int = SG_WINDOW_SIZE, per_norm: int = 98):
+    # the slope stage of rgt's get_signal_atac over region x position matrices of normalized profiles: each row is
+    # convolved with rgt's Savitzky-Golay kernel by numpy.convolve, as rgt does, then hon normalized; a vectorized
+    # filter rounds differently, turning rgt's ~1e-18 residues into exact zeros that hon normalization passes through
+    # unchanged; as in rgt, the reverse slope is scaled by the standard deviation of the normalized forward slope
+    with metrics.phase("slope"):
+        coefficients = sgCoefficients(window)
+        h = len(coefficients) // 2
+        signals = numpy.stack([ forward, reverse ]).astype(numpy.float64)
+        slope = numpy.empty_like(signals)
+        for i in numpy.ndindex(signals.shape[:-1] if signals.shape[-1] > 0 else ()):
+            slope[i] = numpy.convolve(signals[i], coefficients)[h:h + signals.shape[-1]]
+        f = rowHonNorm(slope[0], rowPercentiles(slope[0], per_norm), slope[0].std(axis = 1))
+        r = rowHonNorm(slope[1], rowPercentiles(slope[1], per_norm), f.std(axis = 1))
+        return f, r
+
+class CutSiteCache:
+
+    # Tn5 cut-site counts over one merged, coordinate-sorted span of a chromosome; regions whose windows fall
+    # inside the span are sliced from it instead of fetching their reads again
+
+    def __init__(self, bam, chromosome: str, start: int, end: int):
+        self.chromosome = chromosome
+        self.start = start
+        self.end = end
+        self.forward, self.reverse = cutSites(bam, chromosome, start, end)
+
+    def __call__(self, chromosome: str, start: int, end: int):
+        if chromosome != self.chromosome or start < self.start or end > self.end:
+            raise ValueError("interval %s:%d-%d is outside of the cached span" % (chromosome, start, end))
+        return self.forward[start - self.start:end - self.start], self.reverse[start - self.start:end - self.start]
+
+class CutSiteBlocks:
+
+    # Tn5 cut-site counts of a whole BAM served from fixed-size blocks, dropping the least recently used blocks
+    # once more than max_blocks are held; batch jobs on the same BAM share one instance per worker
+
+    def __init__(self, bam, block_size: int = CUT_BLOCK_SIZE, max_blocks: int = CUT_CACHE_BLOCKS):
+        self.bam = bam
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+
+    def block(self, chromosome: str, i: int):
+        key = (chromosome, i)
+        if key in self.blocks:
+            self.blocks.move_to_end(key)
+        else:
+            forward, reverse = cutSites(self.bam, chromosome, i * self.block_size, (i + 1) * self.block_size)
+            self.blocks[key] = forward.astype(numpy.int32), reverse.astype(numpy.int32)
+            if len(self.blocks) > self.max_blocks: self.blocks.popitem(last = False)
+        return self.blocks[key]
+
+    def __call__(self, chromosome: str, start: int, end: int):
+        if start < 0: raise ValueError("start out of range (%d)" % start)
+        size = self.block_size
+        blocks = [ (i, self.block(chromosome, i)) for i in range(start // size, (end - 1) // size + 1) ]
+        return tuple([
+            numpy.concatenate([ x[strand][max(start - i * size, 0):end - i * size] for i, x in blocks ] or [ numpy.zeros(0, dtype = numpy.int32) ])
+            for strand in (0, 1)
+        ])
+
+def cachedSpan(start: int, end: int):
+    # the span of cut-site counts that the bias correction of [start, end) reads
+    return max(0, min(start, start - BIAS_WINDOW // 2)), end + BIAS_WINDOW // 2
+
+def sweepSpans(regions, max_span: int = CUT_CACHE_SPAN):
+    # regions: (index, (chromosome, start, end, ...)) sorted by chromosome and start; yields
+    # (chromosome, start, end, members) for merged spans of at most max_span bases where possible
+    current = None
+    for i, region in regions:
+        chromosome = region[0]
+        start, end = cachedSpan(region[1], region[2])
+        if current is not None and chromosome == current[0] and start <= current[2] and max(end, current[2]) - current[1] <= max_span:
+            current[2] = max(end, current[2])
+            current[3].append((i, region))
+            continue
+        if current is not None: yield tuple(current)
+        current = [ chromosome, start, end, [ (i, region) ] ]
+    if current is not None: yield tuple(current)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import sys
+import math
+import numpy
+
+from pysam import Fastafile, Samfile
+
+from .constants import *
+from .signal import biasCorrection, CutSiteCache
+
+# genome-wide per-strand bias-corrected Tn5 insertion tracks; the bias-corrected value at a position only
+# depends on the reads and k-mers within BIAS_WINDOW of it, so it can be computed once per BAM and the
+# per-region normalization applied at query time
+
+def trackPaths(prefix: str):
+    return prefix + ".forward.bw", prefix + ".reverse.bw"
+
+def trackBounds(length: int, k: int):
+    # positions whose windows need neither rgt's raw-count fallback near the chromosome start nor a
+    # sequence clipped at the chromosome end
+    return BIAS_WINDOW // 2 + k // 2 + 1, length - BIAS_WINDOW // 2 - math.ceil(k / 2)
+
+def trackBlocks(chromosomes, k: int, block_size: int = TRACK_BLOCK_SIZE):
+    for chromosome, length in chromosomes:
+        start, end = trackBounds(length, k)
+        for i in range(start, end, block_size):
+            yield chromosome, i, min(i + block_size, end)
+
+def trackBlock(block, bam, sequence, kmer_bias):
+    chromosome, start, end = block
+    counts = CutSiteCache(bam, chromosome, start - BIAS_WINDOW // 2, end + BIAS_WINDOW // 2)
+    if not counts.forward.any() and not counts.reverse.any():
+        return chromosome, start, None, None
+    forward, reverse = biasCorrection(counts, sequence, chromosome, start, end, kmer_bias)
+    return chromosome, start, forward, reverse
+
+def writeRuns(bw, chromosome: str, start: int, values):
+    # only non-zero runs are stored; missing positions read back as zero
+    nonzero = numpy.r_[ False, values != 0, False ]
+    edges = numpy.flatnonzero(nonzero[1:] != nonzero[:-1])
+    for s, e in zip(edges[::2], edges[1::2]):
+        bw.addEntries(chromosome, int(start + s), values = values[s:e].astype(numpy.float64), span = 1, step = 1)
+
+def buildTracks(bam: str, genome: str, k: int, prefix: str, blocks):
+    # blocks(iterable) yields trackBlock results in order, e.g. through a process pool's imap
+    with Samfile(bam, "rb") as b, Fastafile(genome) as f:
+        chromosomes = [ (c, l) for c, l in zip(b.references, b.lengths) if c in set(f.references) ]
+    import pyBigWig
+    forward, reverse = [ pyBigWig.open(x, "w") for x in trackPaths(prefix) ]
+    try:
+        for x in [ forward, reverse ]: x.addHeader(chromosomes, maxZooms = 0)
+        for i, (chromosome, start, f, r) in enumerate(blocks(trackBlocks(chromosomes, k))):
+            if f is not None:
+                writeRuns(forward, chromosome, start, f)
+                writeRuns(reverse, chromosome, start, r)
+            if i % 100 == 0: print("INFO: precomputed block %d at %s:%d" % (i, chromosome, start), file = sys.stderr)
+    finally:
+        forward.close()
+        reverse.close()
+
+class SignalTracks:
+
+    # reads bias-corrected signal for a region from precomputed tracks
+
+    def __init__(self, prefix: str, k: int):
+        import pyBigWig
+        self.forward, self.reverse = [ pyBigWig.open(x) for x in trackPaths(prefix) ]
+        self.bounds = { c: trackBounds(l, k) for c, l in self.forward.chroms().items() }
+
+    def covers(self, chromosome: str, start: int, end: int) -> bool:
+        return chromosome in self.bounds and self.bounds[chromosome][0] <= start and end <= self.bounds[chromosome][1]
+
+    def __call__(self, chromosome: str, start: int, end: int):
+        values = lambda x: numpy.nan_to_num(numpy.asarray(x.values(chromosome, start, end, numpy = True), dtype = numpy.float64))
+        return values(self.forward), values(self.reverse)
+
+    def close(self):
+        self.forward.close()
+        self.reverse.close()
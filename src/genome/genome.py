@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import fcntl
+import shutil
+import tarfile
+import tempfile
+import subprocess
+
+from configparser import ConfigParser
+from contextlib import contextmanager
+
+# genome data under RGTDATA is prepared at most once per assembly: jobs that find it missing wait on a lock while
+# one of them imports or downloads it, and the FASTA index and chromosome sizes are built and checked before a stamp
+# records the prepared files, so later jobs only compare the stamp with the files and never touch the network
+
+SETUP_SCRIPT = "/reg-gen/data/setupGenomicData.py"
+STAMP_SUFFIX = ".prepared"
+
+def dataRoot() -> str:
+    return os.environ["RGTDATA"] if "RGTDATA" in os.environ else "/rgtdata"
+
+def assemblies(root: str) -> dict:
+    # assembly -> { "genome": path, "chromosome_sizes": path, ... } for every section of data.config and
+    # data.config.user that names a genome, as rgt reads them
+    config = ConfigParser()
+    config.read([ os.path.join(root, "data.config"), os.path.join(root, "data.config.user") ])
+    return { s: { k: os.path.join(root, v) for k, v in config.items(s) } for s in config.sections() if config.has_option(s, "genome") }
+
+def readIndex(fai: str) -> dict:
+    # name -> (length, offset, bases per line, bytes per line) of a FASTA index
+    with open(fai, 'r') as f:
+        rows = [ x.rstrip('\n').split('\t') for x in f if x.strip() ]
+    return { x[0]: (int(x[1]), int(x[2]), int(x[3]), int(x[4])) for x in rows }
+
+def readSizes(path: str) -> dict:
+    with open(path, 'r') as f:
+        rows = [ x.split() for x in f if x.strip() and not x.startswith('#') ]
+    return { x[0]: int(x[1]) for x in rows }
+
+def checkIndex(genome: str, index: dict):
+    # raises ValueError if the index is empty or points past the end of the FASTA, e.g. after a truncated download
+    if len(index) == 0:
+        raise ValueError("%s.fai lists no sequences" % genome)
+    size = os.path.getsize(genome)
+    for name, (length, offset, bases, width) in index.items():
+        end = offset + (length - 1) // bases * width + (length - 1) % bases + 1 if length > 0 else offset
+        if end > size:
+            raise ValueError("%s is truncated: %s ends at byte %d of %d" % (genome, name, end, size))
+
+def writeSizes(path: str, index: dict):
+    with tempfile.NamedTemporaryFile('w', dir = os.path.dirname(os.path.abspath(path)), delete = False) as o:
+        for name, x in index.items():
+            o.write("%s\t%d\n" % (name, x[0]))
+    os.chmod(o.name, 0o644)
+    os.replace(o.name, path)
+
+def prepareIndex(genome: str, sizes: str):
+    # builds the FASTA index if it is missing or older than the FASTA and the chromosome sizes if they are missing,
+    # then checks them against each other; raises ValueError if they disagree
+    fai = genome + ".fai"
+    if not os.path.exists(fai) or os.path.getmtime(fai) < os.path.getmtime(genome):
+        from pysam import faidx, SamtoolsError
+        try:
+            faidx(genome)
+        except SamtoolsError as e:
+            raise ValueError("unable to index %s: %s" % (genome, e))
+    index = readIndex(fai)
+    checkIndex(genome, index)
+    if not os.path.exists(sizes):
+        writeSizes(sizes, index)
+        return
+    # chromosome sizes may list contigs the FASTA lacks, which filtering ignores, but shared ones must agree
+    known = readSizes(sizes)
+    shared = [ x for x in known if x in index ]
+    if len(shared) == 0:
+        raise ValueError("no chromosome of %s is in %s" % (sizes, genome))
+    for x in shared:
+        if known[x] != index[x][0]:
+            raise ValueError("%s is %d bp in %s but %d bp in %s" % (x, known[x], sizes, index[x][0], genome))
+
+def fileStates(paths) -> list:
+    return [ [ os.stat(x).st_size, os.stat(x).st_mtime_ns ] for x in paths ]
+
+def preparedFiles(genome: str, sizes: str) -> list:
+    return [ genome, genome + ".fai", sizes ]
+
+def isPrepared(genome: str, sizes: str) -> bool:
+    # whether the stamp matches the current genome, index and chromosome sizes
+    try:
+        with open(genome + STAMP_SUFFIX, 'r') as f:
+            return json.load(f) == fileStates(preparedFiles(genome, sizes))
+    except (OSError, ValueError):
+        return False
+
+def writeStamp(genome: str, sizes: str):
+    # a read-only data root cannot be stamped; its checks are then repeated by every job, which is cheap
+    try:
+        with tempfile.NamedTemporaryFile('w', dir = os.path.dirname(os.path.abspath(genome)), delete = False) as o:
+            json.dump(fileStates(preparedFiles(genome, sizes)), o)
+        os.chmod(o.name, 0o644)
+        os.replace(o.name, genome + STAMP_SUFFIX)
+    except OSError:
+        pass
+
+@contextmanager
+def preparationLock(root: str, assembly: str):
+    # an exclusive lock on <root>/.<assembly>.lock; without a writable data root there is nothing to prepare
+    # concurrently, so preparation goes ahead unlocked
+    try:
+        os.makedirs(root, exist_ok = True)
+        f = open(os.path.join(root, ".%s.lock" % assembly), 'a')
+    except OSError:
+        yield
+        return
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("INFO: waiting for another job to prepare genome data for %s" % assembly, file = sys.stderr)
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def importTarball(tarball: str, directory: str):
+    # unpacks a tarball of genome files, at its top level or inside a single directory, into directory; members
+    # are unpacked next to it first and only moved into place once the whole archive has been read
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok = True)
+    staging = tempfile.mkdtemp(dir = parent, prefix = ".import-")
+    try:
+        with tarfile.open(tarball) as t:
+            members = t.getmembers()
+            for m in members:
+                if not (m.isfile() or m.isdir()) or os.path.isabs(m.name) or os.path.normpath(m.name).split(os.sep)[0] == "..":
+                    raise ValueError("refusing to unpack %s from %s" % (m.name, tarball))
+            t.extractall(staging, members, **({ "filter": "data" } if hasattr(tarfile, "data_filter") else {}))
+        entries = os.listdir(staging)
+        source = os.path.join(staging, entries[0]) if len(entries) == 1 and os.path.isdir(os.path.join(staging, entries[0])) else staging
+        os.makedirs(directory, exist_ok = True)
+        for x in os.listdir(source):
+            os.replace(os.path.join(source, x), os.path.join(directory, x))
+    finally:
+        shutil.rmtree(staging, ignore_errors = True)
+
+def download(assembly: str) -> bool:
+    if not os.path.exists(SETUP_SCRIPT):
+        print("FATAL: %s is not available to download genome data." % SETUP_SCRIPT, file = sys.stderr)
+        return False
+    return subprocess.run([ sys.executable, SETUP_SCRIPT, "--" + assembly ]).returncode == 0
+
+def prepareGenome(assembly: str, tarball: str = None, offline: bool = False, root: str = None) -> bool:
+    # makes the genome data of an assembly ready for use unless it already is, importing it from tarball if given or
+    # downloading it if it is missing and offline is not set; returns False after printing the reason if it cannot be used
+    root = dataRoot() if root is None else root
+    configured = assemblies(root)
+    if assembly not in configured:
+        print("FATAL: assembly {assembly} is not configured in {root}/data.config; configured assemblies are {known}.".format(
+            assembly = assembly, root = root, known = ", ".join(sorted(configured)) or "none"
+        ), file = sys.stderr)
+        return False
+    genome = configured[assembly]["genome"]
+    sizes = configured[assembly].get("chromosome_sizes", os.path.join(root, assembly, "chrom.sizes.%s" % assembly))
+    if isPrepared(genome, sizes):
+        return True
+
+    with preparationLock(root, assembly):
+        # another job may have prepared the data while this one waited for the lock
+        if isPrepared(genome, sizes):
+            return True
+        if tarball is not None:
+            print("INFO: importing genome data for %s from %s" % (assembly, tarball), file = sys.stderr)
+            try:
+                importTarball(tarball, os.path.dirname(genome))
+            except (OSError, ValueError, tarfile.TarError) as e:
+                print("FATAL: Unable to import genome data for %s: %s" % (assembly, e), file = sys.stderr)
+                return False
+        elif not os.path.exists(genome):
+            if offline:
+                print("FATAL: genomic data is not present for {assembly} at {genome} and --offline is set.".format(
+                    assembly = assembly, genome = genome
+                ), file = sys.stderr)
+                return False
+            print(
+                "WARNING: genomic data is not present for {assembly}. We will attempt to download it.".format(assembly = assembly),
+                file = sys.stderr
+            )
+            print(
+                "If you are running many jobs, they might run faster if you mount the appropriate data at {root}/{assembly}.".format(root = root, assembly = assembly),
+                file = sys.stderr
+            )
+            if not download(assembly) or not os.path.exists(genome):
+                print("FATAL: Unable to load genome data for {assembly}.".format(assembly = assembly), file = sys.stderr)
+                return False
+        try:
+            prepareIndex(genome, sizes)
+        except (OSError, ValueError) as e:
+            print("FATAL: Invalid genome data for %s: %s" % (assembly, e), file = sys.stderr)
+            return False
+        writeStamp(genome, sizes)
+    return True
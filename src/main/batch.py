@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import sys
+import math
+
+from argparse import ArgumentParser, Namespace
+from multiprocessing import Pool
+from rgt.Util import GenomeData
+
+from ..footprint.footprint import footprintJob, loadBiasTable
+from ..genome.genome import prepareGenome
+from .run import options, biasTables, regions, slopeWindow, write
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.main batch", description = "computes signal for every job of a manifest, loading bias tables and genome data once")
+    parser.add_argument("--manifest", type = str, help = "tab-separated file with one job per line: path to BAM, path to BED, output path", required = True)
+    parser.add_argument("--threads", "--workers", dest = "threads", type = int, default = 1,
+                        help = "number of worker processes across which to spread jobs; default is 1 (serial)")
+    return options(parser).parse_args(argv)
+
+def loadManifest(path: str):
+    # (bam, bed, output) for each line, skipping blank lines and lines starting with '#'
+    jobs = []
+    with open(path, 'r') as f:
+        for i, line in enumerate(f):
+            if not line.strip() or line[0] == '#': continue
+            x = line.rstrip('\n').split('\t')
+            if len(x) < 3: raise ValueError("line %d of %s does not have bam, bed and output columns" % (i + 1, path))
+            jobs.append(tuple(x[:3]))
+    return jobs
+
+# per-process batch state; set once by initBatchWorker in each worker (or in the parent for serial runs)
+_batch = None
+
+def initBatchWorker(cArgs, genome: str, bias_table):
+    global _batch
+    _batch = { "args": cArgs, "genome": genome, "bias_table": bias_table }
+
+def runJob(job):
+    i, (bam, bed, output) = job
+    cArgs = Namespace(**dict(vars(_batch["args"]), bam = bam, bed = bed, output_file = output, plot_output = None, plot_motifs = False, font = None))
+    try:
+        with regions(cArgs, bed) as b:
+            write(cArgs, footprintJob(bam, b, _batch["genome"], _batch["bias_table"], cArgs.ext_size, cArgs.dnase, slope_window = slopeWindow(cArgs)))
+    except Exception as e:
+        return i, "%s: %s" % (type(e).__name__, e)
+    return i, None
+
+def main(argv):
+    cArgs = args(argv)
+
+    if cArgs.max_per_motif is not None and cArgs.max_per_motif < 1:
+        print("FATAL: --max-per-motif must be at least 1.", file = sys.stderr)
+        return 1
+
+    if cArgs.slope_window < 3 or cArgs.slope_window % 2 == 0:
+        print("FATAL: --slope-window must be an odd number of at least 3.", file = sys.stderr)
+        return 1
+
+    try:
+        tables = biasTables(cArgs)
+    except ValueError as e:
+        print("FATAL: %s." % e, file = sys.stderr)
+        return 1
+
+    try:
+        jobs = loadManifest(cArgs.manifest)
+    except (OSError, ValueError) as e:
+        print("FATAL: unable to read manifest: %s" % e, file = sys.stderr)
+        return 1
+
+    if not prepareGenome(cArgs.assembly, cArgs.genome_tarball, cArgs.offline):
+        return 1
+
+    g = GenomeData(organism = cArgs.assembly)
+    bias_table = loadBiasTable(cArgs.dnase, cArgs.bias_type, tables)
+
+    # jobs are ordered by BAM and handed out in runs, so that a worker mostly sees consecutive jobs on one BAM
+    # and reuses its handles and cut-site blocks
+    ordered = sorted(enumerate(jobs), key = lambda x: (x[1][0], x[0]))
+    failed = 0
+    pool = None
+    if cArgs.threads > 1:
+        pool = Pool(cArgs.threads, initializer = initBatchWorker, initargs = (cArgs, g.get_genome(), bias_table))
+        results = pool.imap_unordered(runJob, ordered, chunksize = max(1, math.ceil(len(ordered) / (cArgs.threads * 4))))
+    else:
+        initBatchWorker(cArgs, g.get_genome(), bias_table)
+        results = map(runJob, ordered)
+    try:
+        for i, error in results:
+            if error is not None:
+                failed += 1
+                print("WARNING: job %d (%s, %s) failed: %s" % (i + 1, jobs[i][0], jobs[i][1], error), file = sys.stderr)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    print("INFO: completed %d of %d jobs" % (len(jobs) - failed, len(jobs)), file = sys.stderr)
+    return 1 if failed > 0 else 0
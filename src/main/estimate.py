@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import sys
+
+from argparse import ArgumentParser
+from pysam import Fastafile, Samfile
+
+from ..footprint.constants import *
+from ..footprint.estimate import estimateBias, sampleRegions, writeTable
+from ..regions.bed import readRegions
+from ..genome.genome import prepareGenome
+from .run import genomeOptions
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.main estimate-bias", description = "estimates k-mer Tn5 cleavage bias tables from a BAM, e.g. of naked DNA or of the sample itself")
+    parser.add_argument("--bam", type = str, help = "path to alignments in BAM format", required = True)
+    parser.add_argument("--output-prefix", type = str, help = "writes tables to <prefix>_F.txt and <prefix>_R.txt, for --bias-table-f and --bias-table-r", required = True)
+    parser.add_argument("--assembly", type = str, help = "genomic assembly to use", default = "hg38")
+    genomeOptions(parser)
+    parser.add_argument("--regions", type = str, default = None,
+                        help = "BED file of regions in which to count cut sites and k-mers; default is --samples windows drawn uniformly from the genome")
+    parser.add_argument("--samples", type = int, default = ESTIMATION_SAMPLES,
+                        help = "number of windows to sample if --regions is not given; default is %d" % ESTIMATION_SAMPLES)
+    parser.add_argument("--window", type = int, default = ESTIMATION_WINDOW, help = "size of the sampled windows; default is %d" % ESTIMATION_WINDOW)
+    parser.add_argument("--seed", type = int, default = 0, help = "random seed for sampling windows; default is 0")
+    parser.add_argument("--k", type = int, default = 8, help = "k-mer length; default is 8")
+    parser.add_argument("--forward-shift", type = int, default = ESTIMATION_FORWARD_SHIFT,
+                        help = "shift of forward-strand cut sites, as in rgt's bias estimation; default is %d" % ESTIMATION_FORWARD_SHIFT)
+    parser.add_argument("--reverse-shift", type = int, default = ESTIMATION_REVERSE_SHIFT,
+                        help = "shift of reverse-strand cut sites, as in rgt's bias estimation; default is %d" % ESTIMATION_REVERSE_SHIFT)
+    return parser.parse_args(argv)
+
+def main(argv):
+    cArgs = args(argv)
+
+    if cArgs.k < 1 or cArgs.window < 1 or cArgs.samples < 1:
+        print("FATAL: --k, --window and --samples must be at least 1.", file = sys.stderr)
+        return 1
+
+    if not prepareGenome(cArgs.assembly, cArgs.genome_tarball, cArgs.offline):
+        return 1
+
+    from rgt.Util import GenomeData
+    genome = GenomeData(organism = cArgs.assembly).get_genome()
+    if cArgs.regions is not None:
+        regions = readRegions(cArgs.regions)
+    else:
+        with Samfile(cArgs.bam, "rb") as b, Fastafile(genome) as f:
+            references = set(b.references)
+            lengths = { c: l for c, l in zip(f.references, f.lengths) if c in references }
+        regions = sampleRegions(lengths, cArgs.samples, cArgs.window, cArgs.seed)
+        print("INFO: sampled %d windows of %d bp" % (len(regions), cArgs.window), file = sys.stderr)
+
+    try:
+        forward, reverse = estimateBias(cArgs.bam, genome, regions, cArgs.k, cArgs.forward_shift, cArgs.reverse_shift)
+    except ValueError as e:
+        print("FATAL: unable to estimate bias: %s" % e, file = sys.stderr)
+        return 1
+    writeTable(cArgs.output_prefix + "_F.txt", forward, cArgs.k)
+    writeTable(cArgs.output_prefix + "_R.txt", reverse, cArgs.k)
+    print("INFO: wrote %s_F.txt and %s_R.txt" % (cArgs.output_prefix, cArgs.output_prefix), file = sys.stderr)
+    return 0
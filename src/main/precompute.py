@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import sys
+
+from argparse import ArgumentParser
+
+from ..footprint.footprint import precompute
+from .run import biasTables
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.main precompute", description = "precomputes genome-wide bias-corrected ATAC-seq insertion tracks")
+    parser.add_argument("--bam", type = str, help = "path to alignments in BAM format", required = True)
+    parser.add_argument("--output-prefix", type = str, help = "writes tracks to <prefix>.forward.bw and <prefix>.reverse.bw", required = True)
+    parser.add_argument("--assembly", type = str, help = "genomic assembly to use", default = "hg38")
+    parser.add_argument("--threads", "--workers", dest = "threads", type = int, default = 1,
+                        help = "number of worker processes across which to spread genomic blocks; default is 1 (serial)")
+    parser.add_argument("--bias-table-f", type = str, default = None, help = "path to a custom forward-strand k-mer bias table; requires --bias-table-r")
+    parser.add_argument("--bias-table-r", type = str, default = None, help = "path to a custom reverse-strand k-mer bias table; requires --bias-table-f")
+    return parser.parse_args(argv)
+
+def main(argv):
+    cArgs = args(argv)
+    try:
+        tables = biasTables(cArgs)
+    except ValueError as e:
+        print("FATAL: %s." % e, file = sys.stderr)
+        return 1
+    precompute(cArgs.bam, cArgs.output_prefix, cArgs.assembly, cArgs.threads, tables)
+    return 0
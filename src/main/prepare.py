@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+from argparse import ArgumentParser
+
+from ..genome.genome import prepareGenome
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.main prepare-genome",
+                            description = "prepares an assembly's genome data in RGTDATA once, so later jobs start without downloading or indexing it")
+    parser.add_argument("--assembly", type = str, help = "genomic assembly to prepare, as named in data.config", default = "hg38")
+    parser.add_argument("--tarball", type = str, default = None,
+                        help = "if set, imports the genome data from this tarball, e.g. src/test/resources/hg38-chrM.tar.gz, rather than downloading it")
+    parser.add_argument("--offline", action = "store_true", default = False, help = "if set, fails rather than downloading missing genome data")
+    return parser.parse_args(argv)
+
+def main(argv):
+    cArgs = args(argv)
+    return 0 if prepareGenome(cArgs.assembly, cArgs.tarball, cArgs.offline) else 1
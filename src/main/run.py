@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import sys
+import json
+
+from contextlib import nullcontext
+
+from ..regions.filter import FilteredRegions, OCCURRENCE_SELECTIONS
+from ..aggregate.aggregate import aggregate
+from ..plot.plot import plot, plotMotifs
+from ..output.matrix import MatrixWriter, MATRIX_FORMATS, PROFILES, SLOPE_PROFILES
+from ..footprint.constants import SG_WINDOW_SIZE
+from ..output.stream import RegionWriter, STREAM_FORMATS
+from ..metrics.metrics import metrics
+
+# setup and output shared by single runs and batch jobs
+
+def genomeOptions(parser):
+    # how prepareGenome gets genome data that is not present in RGTDATA; shared by every subcommand that reads the genome
+    parser.add_argument("--genome-tarball", type = str, default = None,
+                        help = "if set, imports the assembly's genome data from this tarball into RGTDATA rather than downloading it")
+    parser.add_argument("--offline", action = "store_true", default = False,
+                        help = "if set, fails rather than downloading genome data that is not present in RGTDATA")
+    return parser
+
+def options(parser):
+    # options that apply to every job of a batch as well as to single runs
+    parser.add_argument("--assembly", type = str, help = "genomic assembly to use", default = "hg38")
+    genomeOptions(parser)
+    parser.add_argument("--ext-size", type = int, help = "expands regions by the given number of basepairs around their centers", default = 500)
+    parser.add_argument("--aggregate", action = "store_true", help = "if set, outputs aggregate signal rather than profiles for each region", default = False)
+    parser.add_argument("--occurrence-threshold", type = float, help = "specificies that the given BED file contains FIMO occurrences which should be filtered at this q-value.", default = None)
+    parser.add_argument("--max-per-motif", type = int, default = None,
+                        help = "if set, keeps at most this many occurrences of each motif; only applies if --occurrence-threshold is set")
+    parser.add_argument("--motif-selection", type = str, choices = OCCURRENCE_SELECTIONS, default = "best",
+                        help = "how --max-per-motif picks occurrences: best (lowest q-values, default) or reservoir (seeded uniform sample)")
+    parser.add_argument("--seed", type = int, default = 0, help = "random seed for --motif-selection reservoir; default is 0")
+    parser.add_argument("--dnase", action = "store_true", default = False, help = "if set, specifies that bias correction should be for DNase I")
+    parser.add_argument("--output-format", type = str, choices = STREAM_FORMATS + MATRIX_FORMATS, default = "json",
+                        help = ("format for per-region profiles: json (default), jsonl (one region per line), tsv (one region per row), "
+                                "or npz/hdf5 (float32 region x position matrices; requires --output-file); only applies if --aggregate is not set"))
+    parser.add_argument("--emit-slope", action = "store_true", default = False,
+                        help = "if set, adds Savitzky-Golay slopes of the profiles to per-region output as forward_slope and reverse_slope")
+    parser.add_argument("--slope-window", type = int, default = SG_WINDOW_SIZE,
+                        help = "odd window size of the Savitzky-Golay filter used by --emit-slope; default is %d" % SG_WINDOW_SIZE)
+    parser.add_argument("--output-as-tsv", action = "store_true", help = "if specified, outputs values in TSV rather than JSON format; only applies if --aggregate is set", default = False)
+    parser.add_argument("--bias-table-f", type = str, default = None,
+                        help = "path to a custom forward-strand k-mer bias table, e.g. from estimate-bias; requires --bias-table-r")
+    parser.add_argument("--bias-table-r", type = str, default = None,
+                        help = "path to a custom reverse-strand k-mer bias table, e.g. from estimate-bias; requires --bias-table-f")
+    parser.add_argument("--bias-type", dest="bias_type", type = str, metavar = "STRING", default = "SH",
+                        help=("Type of protocol used to generate the DNase-seq. "
+                              "Available options are: 'SH' (DNase-seq single-hit protocol), 'DH' "
+                              "(DNase-seq double-hit protocol). DEFAULT: SH"))
+    return parser
+
+def biasTables(cArgs):
+    # the (forward, reverse) custom table paths, or None for the RGT tables; raises ValueError if only one is given
+    if cArgs.bias_table_f is None and cArgs.bias_table_r is None: return None
+    if cArgs.bias_table_f is None or cArgs.bias_table_r is None:
+        raise ValueError("--bias-table-f and --bias-table-r must be given together")
+    return cArgs.bias_table_f, cArgs.bias_table_r
+
+def writeProfile(path: str, seconds: float):
+    # phases nest: "write" covers "footprint" (time spent producing profiles, itself covering "setup", "regions"
+    # and the per-region phases), and "output" is the remainder spent aggregating, plotting and serializing;
+    # per-region phases of pool workers are summed over workers
+    report = metrics.report()
+    phases = report["phases"]
+    phases["total"] = seconds
+    if "write" in phases and "footprint" in phases: phases["output"] = phases["write"] - phases["footprint"]
+    report["regions_per_second"] = report["counts"].get("regions", 0) / phases["footprint"] if phases.get("footprint") else None
+    with open(path, 'w') as o:
+        json.dump(report, o, indent = 2)
+
+def slopeWindow(cArgs):
+    # the slope window to pass to footprint(), or None if slopes are not written
+    if not cArgs.emit_slope: return None
+    if cArgs.aggregate or cArgs.plot_output is not None:
+        print("WARNING: --emit-slope only applies to per-region output; ignoring it", file = sys.stderr)
+        return None
+    return cArgs.slope_window
+
+def regions(cArgs, bed: str):
+    # the regions of a BED file, or the filtered occurrences of a FIMO file if --occurrence-threshold is set
+    if cArgs.occurrence_threshold is None:
+        return nullcontext(bed)
+    from rgt.Util import GenomeData
+    g = GenomeData(organism = cArgs.assembly)
+    return FilteredRegions(
+        bed, cArgs.occurrence_threshold, g.get_genome(), g.get_chromosome_sizes(), cArgs.max_per_motif, cArgs.motif_selection, cArgs.seed
+    )
+
+def write(cArgs, signal):
+    if not cArgs.aggregate and cArgs.plot_output is None and cArgs.output_format in MATRIX_FORMATS:
+        profiles = PROFILES + SLOPE_PROFILES if slopeWindow(cArgs) is not None else PROFILES
+        with MatrixWriter(cArgs.output_file, cArgs.ext_size * 2, cArgs.output_format, profiles = profiles) as o:
+            for x in signal: o.write(x)
+        return
+
+    with (open(cArgs.output_file, 'w') if cArgs.output_file is not None else nullcontext(sys.stdout)) as o:
+        if cArgs.aggregate or cArgs.plot_output is not None:
+            signal = aggregate(signal, (lambda x: "all") if cArgs.occurrence_threshold is None else lambda x: x["name"], cArgs.ext_size)
+            if cArgs.plot_output is not None and cArgs.plot_motifs:
+                with metrics.phase("plot"):
+                    plotMotifs(signal, cArgs.font, cArgs.plot_output, cArgs.threads)
+            elif cArgs.plot_output is not None:
+                with metrics.phase("plot"):
+                    plot(signal["all"]["mean"]["forward"], signal["all"]["mean"]["reverse"], cArgs.font, cArgs.plot_output)
+            if not cArgs.output_as_tsv or not cArgs.aggregate:
+                o.write(json.dumps(signal) + '\n')
+            else:
+                for k, v in signal.items():
+                    if k != "all":
+                        o.write("%s\t%s\t%s\n" % (k, ','.join([ str(x) for x in v["forward"] ]), ','.join([ str(x) for x in v["reverse"] ])))
+        else:
+            # per-region profiles are written as soon as footprint() yields them
+            with RegionWriter(o, cArgs.output_format) as w:
+                for x in signal: w.write(x)
+
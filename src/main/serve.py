@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import threading
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from rgt.Util import GenomeData
+
+from ..footprint.footprint import footprintJob, loadBiasTable, useSignalWorker
+from ..aggregate.aggregate import aggregate
+from ..output.stream import jsonRegion
+from ..genome.genome import prepareGenome
+from .run import biasTables, genomeOptions
+
+def args(argv):
+    parser = ArgumentParser(prog = "app.main serve", description = "answers footprint queries over HTTP, keeping bias tables, genome and BAM handles loaded between them")
+    parser.add_argument("--bam", type = str, default = None, help = "path to alignments in BAM format used by queries that do not name one; opened at startup")
+    parser.add_argument("--assembly", type = str, help = "genomic assembly to use", default = "hg38")
+    genomeOptions(parser)
+    parser.add_argument("--host", type = str, default = "127.0.0.1", help = "address to listen on; default is 127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000, help = "port to listen on; default is 8000")
+    parser.add_argument("--socket", type = str, default = None, help = "if set, listens on this Unix socket instead of --host and --port")
+    parser.add_argument("--dnase", action = "store_true", default = False, help = "if set, specifies that bias correction should be for DNase I")
+    parser.add_argument("--bias-table-f", type = str, default = None, help = "path to a custom forward-strand k-mer bias table; requires --bias-table-r")
+    parser.add_argument("--bias-table-r", type = str, default = None, help = "path to a custom reverse-strand k-mer bias table; requires --bias-table-f")
+    parser.add_argument("--bias-type", dest="bias_type", type = str, metavar = "STRING", default = "SH",
+                        help=("Type of protocol used to generate the DNase-seq. "
+                              "Available options are: 'SH' (DNase-seq single-hit protocol), 'DH' "
+                              "(DNase-seq double-hit protocol). DEFAULT: SH"))
+    return parser.parse_args(argv)
+
+def queryRegions(regions):
+    # [chromosome, start, end, name, strand] lists, name and strand being optional
+    for x in regions:
+        if len(x) < 3 or len(x) > 5:
+            raise ValueError("regions must be given as [chromosome, start, end, name, strand] with optional name and strand")
+        yield str(x[0]), int(x[1]), int(x[2]), x[3] if len(x) >= 4 else None, x[4] if len(x) >= 5 else '.'
+
+class FootprintService:
+
+    # signal state shared by all connections; pysam handles and the per-process worker state are not
+    # thread-safe, so queries are computed one at a time while connections are read and written concurrently
+
+    def __init__(self, assembly: str, dnase: bool = False, bias_type: str = "SH", bam: str = None, bias_tables = None):
+        self.assembly = assembly
+        self.dnase = dnase
+        self.bam = bam
+        self.genome = GenomeData(organism = assembly).get_genome()
+        self.bias_table = loadBiasTable(dnase, bias_type, bias_tables)
+        self.lock = threading.Lock()
+        if bam is not None:
+            useSignalWorker(bam, self.genome, dnase, self.bias_table)
+
+    def __call__(self, query: dict):
+        # query: { "bam": path, "regions": [ [chromosome, start, end, name, strand], ... ] or "bed": path,
+        # "ext_size": 500, "aggregate": false, "by_name": false }
+        bam = query.get("bam", self.bam)
+        if bam is None: raise ValueError("no BAM given and the server was started without --bam")
+        w = int(query.get("ext_size", 500))
+        bed = str(query["bed"]) if "bed" in query else list(queryRegions(query["regions"]))
+        with self.lock:
+            signal = footprintJob(bam, bed, self.genome, self.bias_table, w, self.dnase)
+            if query.get("aggregate", False):
+                return aggregate(signal, (lambda x: x["name"]) if query.get("by_name", False) else (lambda x: "all"), w)
+            return [ jsonRegion(x) for x in signal ]
+
+class FootprintHandler(BaseHTTPRequestHandler):
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def reply(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/":
+            return self.reply(404, { "error": "unknown path %s" % self.path })
+        self.reply(200, { "assembly": self.server.service.assembly, "dnase": self.server.service.dnase, "bam": self.server.service.bam })
+
+    def do_POST(self):
+        if self.path != "/footprint":
+            return self.reply(404, { "error": "unknown path %s" % self.path })
+        try:
+            result = self.server.service(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            return self.reply(400, { "error": "%s: %s" % (type(e).__name__, e) })
+        except Exception as e:
+            return self.reply(500, { "error": "%s: %s" % (type(e).__name__, e) })
+        self.reply(200, result)
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def main(argv):
+    cArgs = args(argv)
+
+    try:
+        tables = biasTables(cArgs)
+    except ValueError as e:
+        print("FATAL: %s." % e, file = sys.stderr)
+        return 1
+
+    if not prepareGenome(cArgs.assembly, cArgs.genome_tarball, cArgs.offline):
+        return 1
+
+    service = FootprintService(cArgs.assembly, cArgs.dnase, cArgs.bias_type, cArgs.bam, tables)
+    if cArgs.socket is not None:
+        if os.path.exists(cArgs.socket): os.remove(cArgs.socket)
+        server = UnixHTTPServer(cArgs.socket, FootprintHandler)
+        print("INFO: serving footprint queries on %s" % cArgs.socket, file = sys.stderr)
+    else:
+        server = ThreadingHTTPServer((cArgs.host, cArgs.port), FootprintHandler)
+        print("INFO: serving footprint queries on http://%s:%d" % (cArgs.host, server.server_address[1]), file = sys.stderr)
+    server.service = service
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if cArgs.socket is not None and os.path.exists(cArgs.socket): os.remove(cArgs.socket)
+    return 0
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import time
+import cProfile
+
+from contextlib import nullcontext
+
+# optional run instrumentation: cumulative phase durations and event counters, plus an optional cProfile dump;
+# while disabled, every call is a no-op so instrumented code costs next to nothing
+
+NULL_PHASE = nullcontext()
+
+class Phase:
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.metrics.add(self.name, time.perf_counter() - self.start)
+
+class Metrics:
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_path = None
+        self.profiler = None
+        self.phases = {}
+        self.counts = {}
+
+    def enable(self, profile_path: str = None):
+        # profile_path: if set, this process is also run under cProfile and its stats dumped there; anything
+        # inherited from a forking parent is dropped
+        if self.profiler is not None: self.profiler.disable()
+        self.enabled = True
+        self.phases, self.counts = {}, {}
+        self.profile_path = profile_path
+        self.profiler = None
+        if profile_path is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def phase(self, name: str):
+        return Phase(self, name) if self.enabled else NULL_PHASE
+
+    def add(self, name: str, seconds: float):
+        if self.enabled: self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled: self.counts[name] = self.counts.get(name, 0) + n
+
+    def timed(self, name: str, iterable):
+        # yields from iterable, adding the time spent producing each item to the named phase
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                x = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield x
+
+    def drain(self):
+        # phases and counts collected since the last drain, e.g. for a worker to hand back with its results;
+        # also refreshes the cProfile dump, since pool workers are terminated rather than shut down
+        drained = (self.phases, self.counts)
+        self.phases, self.counts = {}, {}
+        self.dump()
+        return drained
+
+    def merge(self, drained):
+        phases, counts = drained
+        for k, v in phases.items(): self.add(k, v)
+        for k, v in counts.items(): self.count(k, v)
+
+    def dump(self):
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_path)
+
+    def report(self):
+        return { "phases": dict(sorted(self.phases.items())), "counts": dict(sorted(self.counts.items())) }
+
+# per-process instance used by all instrumented code
+metrics = Metrics()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import zipfile
+import tempfile
+
+import numpy
+
+MATRIX_FORMATS = [ "npz", "hdf5" ]
+MATRIX_CHUNK_SIZE = 1024
+METADATA = [ "chromosome", "start", "end", "name", "strand" ]
+PROFILES = [ "forward", "reverse" ]
+SLOPE_PROFILES = [ "forward_slope", "reverse_slope" ]
+
+class MatrixWriter:
+
+    # writes per-region profiles as float32 region x position matrices, one per strand (and per slope, if
+    # requested), plus one metadata column per BED field in input order; rows are spooled to disk next to the
+    # output as regions finish and assembled into an uncompressed NPZ or a contiguous HDF5 file on exit, so both
+    # can be memory-mapped
+
+    def __init__(self, path: str, width: int, format: str = "npz", chunk_size: int = MATRIX_CHUNK_SIZE, profiles = PROFILES):
+        if format not in MATRIX_FORMATS:
+            raise ValueError("unsupported matrix format %s" % format)
+        self.path = path
+        self.width = width
+        self.format = format
+        self.chunk_size = chunk_size
+        self.profiles = list(profiles)
+
+    def __enter__(self):
+        spool = lambda mode: tempfile.TemporaryFile(mode, dir = os.path.dirname(os.path.abspath(self.path)))
+        self.spools = { x: spool("w+b") for x in self.profiles }; self.metadata = spool("w+t")
+        self.chunk = numpy.empty((len(self.profiles), self.chunk_size, self.width), dtype = numpy.float32)
+        self.n = 0; self.rows = 0
+        return self
+
+    def write(self, region: dict):
+        # windows clipped at a chromosome end are padded with NaN
+        if any([ len(region[x]) != self.width for x in self.profiles ]): self.chunk[:, self.n] = numpy.nan
+        for i, x in enumerate(self.profiles):
+            self.chunk[i, self.n, :len(region[x])] = region[x]
+        self.metadata.write('\t'.join([ str(region[k]) if region[k] is not None else '.' for k in METADATA ]) + '\n')
+        self.n += 1
+        if self.n == self.chunk_size: self.flush()
+
+    def flush(self):
+        for i, x in enumerate(self.profiles):
+            self.spools[x].write(self.chunk[i, :self.n].tobytes())
+        for x in list(self.spools.values()) + [ self.metadata ]: x.flush()
+        self.rows += self.n; self.n = 0
+
+    def columns(self):
+        self.metadata.seek(0)
+        fields = list(zip(*[ line.rstrip('\n').split('\t') for line in self.metadata ])) or [ () ] * len(METADATA)
+        return {
+            k: numpy.array(v, dtype = numpy.int64) if k in [ "start", "end" ] else numpy.array(v, dtype = str)
+            for k, v in zip(METADATA, fields)
+        }
+
+    def writeNPZ(self):
+        header = { "descr": numpy.lib.format.dtype_to_descr(numpy.dtype(numpy.float32)), "fortran_order": False, "shape": (self.rows, self.width) }
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64 = True) as z:
+            for name, spool in self.spools.items():
+                with z.open(name + ".npy", 'w', force_zip64 = True) as o:
+                    numpy.lib.format.write_array_header_1_0(o, header)
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, o, self.chunk_size * self.width * 4)
+            for name, column in self.columns().items():
+                with z.open(name + ".npy", 'w', force_zip64 = True) as o:
+                    numpy.lib.format.write_array(o, column, allow_pickle = False)
+
+    def writeHDF5(self):
+        try:
+            import h5py
+        except ImportError as e:
+            raise ImportError("HDF5 output requires the h5py package") from e
+        with h5py.File(self.path, 'w') as h:
+            for name, spool in self.spools.items():
+                d = h.create_dataset(name, shape = (self.rows, self.width), dtype = numpy.float32)
+                spool.seek(0)
+                for i in range(0, self.rows, self.chunk_size):
+                    rows = min(self.chunk_size, self.rows - i)
+                    d[i:i + rows] = numpy.fromfile(spool, dtype = numpy.float32, count = rows * self.width).reshape((rows, self.width))
+            for name, column in self.columns().items():
+                h.create_dataset(name, data = numpy.char.encode(column, "utf-8") if column.dtype.kind == 'U' else column)
+
+    def __exit__(self, exc_type, *args):
+        try:
+            if exc_type is None:
+                self.flush()
+                (self.writeNPZ if self.format == "npz" else self.writeHDF5)()
+        finally:
+            for x in list(self.spools.values()) + [ self.metadata ]: x.close()
+
+def loadMatrix(path: str, mmap_mode: str = 'r'):
+    # returns { name: array } for a file written by MatrixWriter, with the profile matrices memory-mapped
+    if not zipfile.is_zipfile(path):
+        import h5py
+        with h5py.File(path, 'r') as h:
+            results = {}
+            for name in [ x for x in PROFILES + SLOPE_PROFILES if x in h ]:
+                offset = h[name].id.get_offset()
+                results[name] = numpy.memmap(path, numpy.float32, mmap_mode, offset, h[name].shape) if offset is not None else h[name][:]
+            for name in METADATA:
+                results[name] = h[name][:].astype(str) if h[name].dtype.kind == 'S' else h[name][:]
+            return results
+    with numpy.load(path, allow_pickle = False) as npz:
+        results = { name: npz[name] for name in METADATA }
+    with zipfile.ZipFile(path, 'r') as z, open(path, 'rb') as f:
+        for name in [ x for x in PROFILES + SLOPE_PROFILES if x + ".npy" in z.namelist() ]:
+            info = z.getinfo(name + ".npy")
+            f.seek(info.header_offset + 26)
+            nameLength, extraLength = numpy.frombuffer(f.read(4), dtype = "<u2")
+            f.seek(info.header_offset + 30 + int(nameLength) + int(extraLength))
+            numpy.lib.format.read_magic(f)
+            shape, _, dtype = numpy.lib.format.read_array_header_1_0(f)
+            results[name] = numpy.memmap(path, dtype, mmap_mode, f.tell(), shape) if shape[0] > 0 else numpy.empty(shape, dtype = dtype)
+    return results
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import json
+import numpy
+
+STREAM_FORMATS = [ "json", "jsonl", "tsv" ]
+TSV_FIELDS = [ "chromosome", "start", "end", "name", "strand" ]
+TSV_PROFILES = [ "forward", "reverse", "forward_slope", "reverse_slope" ]
+
+def profileList(x):
+    # profiles are float32 arrays until they are serialized
+    return x.tolist() if isinstance(x, numpy.ndarray) else x
+
+def jsonRegion(region: dict) -> dict:
+    return { k: profileList(v) for k, v in region.items() }
+
+class RegionWriter:
+
+    # writes each region to an open text file as soon as it is produced; "json" emits the same bytes as
+    # json.dumps() over the whole list, "jsonl" one object per line and "tsv" one row per region with
+    # comma-separated forward and reverse profiles, followed by the slopes if they were computed
+
+    def __init__(self, f, format: str = "json"):
+        if format not in STREAM_FORMATS:
+            raise ValueError("unsupported output format %s" % format)
+        self.f = f
+        self.format = format
+        self.n = 0
+
+    def __enter__(self):
+        if self.format == "json": self.f.write('[')
+        return self
+
+    def write(self, region: dict):
+        if self.format == "tsv":
+            self.f.write('\t'.join(
+                [ str(region[k]) if region[k] is not None else '.' for k in TSV_FIELDS ]
+                + [ ','.join([ str(x) for x in profileList(region[k]) ]) for k in TSV_PROFILES if k in region ]
+            ) + '\n')
+        elif self.format == "jsonl":
+            self.f.write(json.dumps(jsonRegion(region)) + '\n')
+        else:
+            self.f.write((", " if self.n > 0 else "") + json.dumps(jsonRegion(region)))
+        self.n += 1
+
+    def __exit__(self, exc_type, *args):
+        if self.format == "json" and exc_type is None: self.f.write("]\n")
+        self.f.flush()
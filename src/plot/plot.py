@@ -1,18 +1,104 @@
+import math
+import numpy
+
+from multiprocessing import Pool
 from typing import List
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot
+# plots are drawn on Figure objects with the Agg canvas rather than through pyplot, which is slow to import and
+# keeps every figure alive in its global state; matplotlib is only imported for runs that plot
+
+PANEL_SIZE = (4, 3)
+PANEL_DPI = 100
+GRID_COLUMNS = 4
+PANELS_PER_PAGE = 16
+YLABEL = "average bias-corrected Tn5 insertions"
+# small multiples are too short for the full label
+PANEL_YLABEL = "mean corrected insertions"
+PANEL_MARGINS = { "left": 0.19, "right": 0.95, "bottom": 0.16, "top": 0.91 }
+
+def fontProperties(font: str):
+    from matplotlib.font_manager import FontProperties
+    return FontProperties(fname = font)
+
+def drawPanel(ax, forward, reverse, f, title: str = None, legend: bool = True, ylabel: str = YLABEL):
+    # positions are relative to the region center, so the axes follow the profile width (twice --ext-size)
+    w = len(forward) // 2
+    x = numpy.arange(-w, len(forward) - w)
+    ax.plot(x, forward, label = "forward strand")
+    ax.plot(x, reverse, label = "reverse strand")
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.set_xlim(-w, len(forward) - w)
+    ax.set_xticks(numpy.linspace(-w, w, 5).round().astype(int))
+    ax.set_ylim(bottom = min(0, numpy.min(forward, initial = 0), numpy.min(reverse, initial = 0)))
+    ax.set_xlabel("distance from footprint (bp)", fontproperties = f)
+    ax.set_ylabel(ylabel, fontproperties = f)
+    for label in ax.get_xticklabels() + ax.get_yticklabels(): label.set_fontproperties(f)
+    if title is not None: ax.set_title(title, fontproperties = f)
+    if legend: ax.legend(prop = f)
 
 def plot(forward: List[float], reverse: List[float], font: str, output: str):
-    f = matplotlib.font_manager.FontProperties(fname = font)
-    matplotlib.pyplot.xlabel("distance from footprint (bp)", fontproperties = f)
-    matplotlib.pyplot.ylabel("average bias-corrected Tn5 insertions", fontproperties = f)
-    matplotlib.pyplot.gca().spines['right'].set_visible(False)
-    matplotlib.pyplot.gca().spines['top'].set_visible(False)
-    matplotlib.pyplot.plot(range(-500, 500), forward, label = "foward strand")
-    matplotlib.pyplot.plot(range(-500, 500), reverse, label = "reverse strand")
-    matplotlib.pyplot.xticks([ -500, -250, 0, 250, 500 ], fontproperties = f)
-    matplotlib.pyplot.yticks(range(0, 1000, 100), fontproperties = f)
-    matplotlib.pyplot.legend(prop = f)
-    matplotlib.pyplot.savefig(output)
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    drawPanel(figure.add_subplot(), forward, reverse, fontProperties(font))
+    figure.savefig(output)
+
+def panels(aggregated: dict):
+    # (title, mean forward, mean reverse) for "all" followed by every motif in name order
+    keys = [ "all" ] + sorted([ k for k in aggregated.keys() if k != "all" ])
+    return [ (k, aggregated[k]["mean"]["forward"], aggregated[k]["mean"]["reverse"]) for k in keys if k in aggregated ]
+
+def panelImage(panel):
+    # one panel rendered to an RGBA array; only the first panel of a grid carries the legend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    (title, forward, reverse), font, legend = panel
+    figure = Figure(figsize = PANEL_SIZE, dpi = PANEL_DPI)
+    canvas = FigureCanvasAgg(figure)
+    drawPanel(figure.add_subplot(), forward, reverse, fontProperties(font), title, legend, PANEL_YLABEL)
+    # tiles share one size, so fixed margins stand in for tight_layout, which costs as much as drawing
+    figure.subplots_adjust(**PANEL_MARGINS)
+    canvas.draw()
+    return numpy.asarray(canvas.buffer_rgba()).copy()
+
+def plotGrid(panels, font: str, output: str, threads: int = 1, columns: int = GRID_COLUMNS):
+    # panels are rendered independently, in parallel if requested, and tiled into a single image
+    from matplotlib.image import imsave
+    jobs = [ (x, font, i == 0) for i, x in enumerate(panels) ]
+    if threads > 1 and len(jobs) > 1:
+        with Pool(min(threads, len(jobs))) as pool:
+            tiles = pool.map(panelImage, jobs)
+    else:
+        tiles = [ panelImage(x) for x in jobs ]
+    h, w = tiles[0].shape[:2]
+    columns = min(columns, len(tiles))
+    grid = numpy.full((math.ceil(len(tiles) / columns) * h, columns * w, 4), 255, dtype = numpy.uint8)
+    for i, tile in enumerate(tiles):
+        grid[(i // columns) * h:(i // columns + 1) * h, (i % columns) * w:(i % columns + 1) * w] = tile
+    imsave(output, grid, dpi = PANEL_DPI)
+
+def plotPages(panels, font: str, output: str, columns: int = GRID_COLUMNS, per_page: int = PANELS_PER_PAGE):
+    # a multi-page PDF with up to per_page panels on each page; vector pages are drawn in this process
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+    f = fontProperties(font)
+    columns = min(columns, len(panels))
+    with PdfPages(output) as pdf:
+        for i in range(0, len(panels), per_page):
+            page = panels[i:i + per_page]
+            rows = math.ceil(len(page) / columns)
+            figure = Figure(figsize = (PANEL_SIZE[0] * columns, PANEL_SIZE[1] * rows))
+            for j, (title, forward, reverse) in enumerate(page):
+                drawPanel(figure.add_subplot(rows, columns, j + 1), forward, reverse, f, title, i + j == 0, PANEL_YLABEL)
+            figure.tight_layout()
+            pdf.savefig(figure)
+
+def plotMotifs(aggregated: dict, font: str, output: str, threads: int = 1):
+    # small multiples of the mean profile of every key of aggregate() output: pages of panels for PDF output,
+    # one grid image for any other format
+    if output.lower().endswith(".pdf"):
+        plotPages(panels(aggregated), font, output)
+    else:
+        plotGrid(panels(aggregated), font, output, threads)
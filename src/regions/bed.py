@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+import gzip
+
+def openText(path: str):
+    # opens plain or gzip-compressed text, detected from the magic bytes rather than the file name
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, 'rt') if compressed else open(path, 'r')
+
+def readRegions(path: str):
+    # yields (chromosome, start, end, name, strand) from a BED file, splitting each line once; name is None
+    # and strand is '.' when the columns are absent
+    with openText(path) as f:
+        for line in f:
+            x = line.split()
+            if len(x) == 0: continue
+            yield x[0], int(x[1]), int(x[2]), x[3] if len(x) >= 4 else None, x[4] if len(x) >= 5 else '.'
@@ -2,27 +2,94 @@
 
 import os
 import sys
-import tempfile
+import heapq
+import random
+
+from .bed import openText
+from ..metrics.metrics import metrics
+
+def fastaChromosomes(fa: str):
+    # sequence names from the FASTA index, building it if it is missing; scanning the FASTA for headers is
+    # only a last resort, e.g. when the index cannot be written next to a read-only genome
+    if not os.path.exists(fa + ".fai"):
+        try:
+            from pysam import faidx
+            faidx(fa)
+        except Exception:
+            print("WARNING: unable to index %s; scanning it for sequence names" % fa, file = sys.stderr)
+    if os.path.exists(fa + ".fai"):
+        with open(fa + ".fai", 'r') as f:
+            return set([ x.split('\t')[0] for x in f if x.strip() ])
+    with open(fa, 'r') as f:
+        return set([ x.strip().split('>')[1].split()[0] for x in f if x[0] == '>' ])
+
+OCCURRENCE_SELECTIONS = [ "best", "reservoir" ]
+
+def capOccurrences(occurrences, n: int, selection: str = "best", seed: int = 0):
+    # occurrences: (q-value, region) in file order; keeps at most n regions per motif (region[3]) in a single pass,
+    # either those with the lowest q-values (earliest first on ties) or a uniform reservoir sample that is
+    # deterministic for a given seed; kept regions are yielded in file order
+    kept = {}; seen = {}; total = 0
+    rng = random.Random(seed)
+    for i, (q, region) in enumerate(occurrences):
+        total += 1
+        motif = region[3]
+        reservoir = kept.setdefault(motif, [])
+        if selection == "best":
+            # min-heap on (-q, -i), so the root is the worst occurrence kept so far
+            item = (-q, -i, region)
+            if len(reservoir) < n:
+                heapq.heappush(reservoir, item)
+            elif item[:2] > reservoir[0][:2]:
+                heapq.heapreplace(reservoir, item)
+        else:
+            c = seen[motif] = seen.get(motif, 0) + 1
+            if len(reservoir) < n:
+                reservoir.append((-1, -i, region))
+            else:
+                j = rng.randrange(c)
+                if j < n: reservoir[j] = (-1, -i, region)
+    regions = sorted([ (-x[1], x[2]) for reservoir in kept.values() for x in reservoir ])
+    print("INFO: kept %d of %d occurrences across %d motifs" % (len(regions), total, len(kept)), file = sys.stderr)
+    for _, region in regions:
+        yield region
 
 class FilteredRegions:
 
-    def __init__(self, path: str, threshold: float, fa: str, chromSizes: str):
+    def __init__(self, path: str, threshold: float, fa: str, chromSizes: str, max_per_motif: int = None, selection: str = "best", seed: int = 0):
         self.path = path
         self.threshold = threshold
+        self.max_per_motif = max_per_motif
+        self.selection = selection
+        self.seed = seed
         with open(chromSizes, 'r') as f:
             self.chromosomes = set([ x.strip().split()[0] for x in f ])
-        with open(fa, 'r') as f:
-            self.chromosomes = self.chromosomes.intersection(set([ x.strip().split('>')[1].split()[0] for x in f if x[0] == '>' ]))
+        self.chromosomes = self.chromosomes.intersection(fastaChromosomes(fa))
     
-    def __enter__(self):
-        self.tempfile = tempfile.NamedTemporaryFile('wt')
-        with open(self.path, 'r') as f:
+    def occurrences(self):
+        # yields (q-value, (chromosome, start, end, motif, strand)) for FIMO occurrences below the q-value threshold
+        # on chromosomes present in the genome; the first line is a header and each line is split once
+        read = kept = 0
+        with openText(self.path) as f:
             f.readline()
             for line in f:
-                if float(line.strip().split()[-1]) < self.threshold and line.strip().split()[1] in self.chromosomes:
-                    self.tempfile.write('\t'.join(line.strip().split()[1:4]) + '\t' + line.strip().split()[0] + '\t' + line.strip().split()[4] + '\n')
-        self.tempfile.flush()
-        return self.tempfile
+                x = line.split()
+                if len(x) == 0: continue
+                read += 1
+                q = float(x[-1])
+                if q < self.threshold and x[1] in self.chromosomes:
+                    kept += 1
+                    yield q, (x[1], int(x[2]), int(x[3]), x[0], x[4])
+        metrics.count("occurrences_read", read)
+        metrics.count("occurrences_kept", kept)
+
+    def __iter__(self):
+        if self.max_per_motif is not None:
+            return capOccurrences(self.occurrences(), self.max_per_motif, self.selection, self.seed)
+        return ( region for _, region in self.occurrences() )
+
+    def __enter__(self):
+        return self
     
     def __exit__(self, *args):
-        self.tempfile.close()
+        pass
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import unittest
+import numpy
+
+from ..aggregate.aggregate import Aggregator
+
+class TestAggregate(unittest.TestCase):
+
+    def assertMoments(self, result, forward, reverse):
+        self.assertEqual(result["count"], len(forward))
+        for strand, x in (("forward", forward), ("reverse", reverse)):
+            self.assertTrue(numpy.allclose(result[strand], x.sum(axis = 0)))
+            self.assertTrue(numpy.allclose(result["mean"][strand], x.mean(axis = 0)))
+            self.assertTrue(numpy.allclose(result["variance"][strand], x.var(axis = 0, ddof = 1)))
+
+    def test_moments(self):
+        # a block of 4 regions splits each key across several flushes; values far from zero exercise the merging
+        random = numpy.random.default_rng(0)
+        keys = [ "A", "all", "B", "A", "B", "B", "A", "all", "C", "A", "B" ]
+        forward = (1e6 + random.random((len(keys), 6))).astype(numpy.float32).astype(numpy.float64)
+        reverse = random.random((len(keys), 6)).astype(numpy.float32).astype(numpy.float64)
+        aggregator = Aggregator(3, block_size = 4)
+        for k, f, r in zip(keys, forward, reverse):
+            aggregator.add(k, f, r)
+        results = aggregator.results()
+        self.assertEqual(sorted(results.keys()), [ "A", "B", "C", "all" ])
+        # regions of a motif named "all" count once towards "all", like every other region
+        self.assertMoments(results["all"], forward, reverse)
+        for k in ("A", "B"):
+            rows = [ i for i, x in enumerate(keys) if x == k ]
+            self.assertMoments(results[k], forward[rows], reverse[rows])
+        self.assertEqual(results["C"]["count"], 1)
+        self.assertEqual(results["C"]["variance"]["forward"], [ 0.0 ] * 6)
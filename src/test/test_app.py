@@ -6,6 +6,7 @@ import unittest
 import math
 import hashlib
 import json
+import zipfile
 
 INPUTS = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources" ) + ":/input"
 GENOME = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources", "hg38-chrM.tar.gz" )
@@ -33,6 +34,120 @@ class TestApp(unittest.TestCase):
                     j = json.load(f)
                     self.assertEqual(len(j), 7)
 
+    def test_json_threads(self):
+        
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --threads 2 > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.json".format(d = d))
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    j = json.load(f)
+                    self.assertEqual(len(j), 7)
+                    self.assertEqual([ x["start"] for x in j ], sorted([ x["start"] for x in j ]))
+
+    def test_genome_tarball(self):
+
+        # the genome directory starts empty and is filled from the tarball, without downloading anything
+        with tempfile.TemporaryDirectory() as g:
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --genome-tarball /input/hg38-chrM.tar.gz --offline > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{g}/genome_hg38-chrM.fa.prepared".format(g = g))
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    j = json.load(f)
+                    self.assertEqual(len(j), 7)
+
+    def test_batch(self):
+        
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                with open("{d}/manifest.tsv".format(d = d), 'w') as f:
+                    f.write("/input/test.bam\t/input/test.bed\t/output/test.json\n")
+                    f.write("/input/test.bam\t/input/test.bed\t/output/test.copy.json\n")
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {d}:/output --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main batch \
+                        --manifest /output/manifest.tsv --assembly hg38-chrM --threads 2 && \
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM > {d}/test.single.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.json".format(d = d))
+                self.assertFileExists("{d}/test.copy.json".format(d = d))
+                with open("{d}/test.json".format(d = d), 'r') as f, open("{d}/test.single.json".format(d = d), 'r') as h:
+                    self.assertEqual(json.load(f), json.load(h))
+
+    def test_serve(self):
+        
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                with open("{d}/query.py".format(d = d), 'w') as f:
+                    f.write("""
+import json, time, urllib.request
+regions = [ x.split()[:3] for x in open("/input/test.bed") ]
+for _ in range(120):
+    try:
+        urllib.request.urlopen("http://127.0.0.1:8765/")
+        break
+    except OSError:
+        time.sleep(1)
+for name, query in [ ("test.json", { "regions": regions }), ("test.aggregate.json", { "bed": "/input/test.bed", "aggregate": True }) ]:
+    request = urllib.request.Request("http://127.0.0.1:8765/footprint", json.dumps(query).encode(), { "Content-Type": "application/json" })
+    with urllib.request.urlopen(request) as r, open("/output/" + name, "wb") as o:
+        o.write(r.read())
+""")
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {d}:/output --volume {g}:/rgtdata/hg38-chrM test sh -c \
+                        "python3 -m app.main serve --bam /input/test.bam --assembly hg38-chrM --offline --port 8765 & python3 /output/query.py" && \
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM > {d}/test.single.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                with open("{d}/test.json".format(d = d), 'r') as f, open("{d}/test.single.json".format(d = d), 'r') as h:
+                    self.assertEqual(json.load(f), json.load(h))
+                with open("{d}/test.aggregate.json".format(d = d), 'r') as f:
+                    j = json.load(f)
+                    self.assertEqual(len(j["all"]["forward"]), 1000)
+
+    def test_profile(self):
+        
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {d}:/output --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --profile /output/profile.json --cprofile /output/test.prof > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.prof".format(d = d))
+                with open("{d}/profile.json".format(d = d), 'r') as f:
+                    j = json.load(f)
+                    self.assertEqual([ x for x in [ "setup", "footprint", "cut_sites", "bias_lookup", "normalize", "output" ] if x not in j["phases"] ], [])
+                    self.assertEqual(j["counts"]["regions"], 7)
+                    self.assertEqual(j["counts"]["reads_fetched"] > 0, True)
+
     def test_aggregate_json(self):
         
         with tempfile.TemporaryDirectory() as g:
@@ -51,6 +166,9 @@ class TestApp(unittest.TestCase):
                     j = json.load(f)
                     self.assertEqual(len(j["all"]["forward"]), 1000)
                     self.assertEqual(len(j["all"]["reverse"]), 1000)
+                    self.assertEqual(j["all"]["count"], 7)
+                    self.assertEqual(len(j["all"]["mean"]["forward"]), 1000)
+                    self.assertEqual(len(j["all"]["variance"]["reverse"]), 1000)
 
     def test_aggregate_json_extsize(self):
         
@@ -124,6 +242,23 @@ class TestApp(unittest.TestCase):
                     raise Exception("unable to run tests")
                 self.assertFileExists("{d}/test.svg".format(d = d))
 
+    def test_plot_motifs(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                for output in [ "test.pdf", "test.png" ]:
+                    if os.system("""
+                        docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main \
+                            --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 --ext-size 100 \
+                            --plot-motifs --plot-output /output/{output} --threads 2 > /dev/null
+                    """.format(inputs = INPUTS, d = d, g = g, output = output)) != 0:
+                        raise Exception("unable to run tests")
+                    self.assertFileExists("{d}/{output}".format(d = d, output = output))
+
     def test_occurrences(self):
 
         with tempfile.TemporaryDirectory() as g:
@@ -166,6 +301,87 @@ class TestApp(unittest.TestCase):
                     j = json.load(f)
                     self.assertEqual(len(j), 9)
 
+    def test_occurrences_max_per_motif(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 --max-per-motif 2 > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.json".format(d = d))
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    j = json.load(f)
+                    self.assertEqual(len(j), 5)
+                    self.assertEqual(max([ len([ y for y in j if y["name"] == x["name"] ]) for x in j ]), 2)
+
+    def test_emit_slope(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --emit-slope --slope-window 11 > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    for x in json.load(f):
+                        self.assertEqual(len(x["forward_slope"]), len(x["forward"]))
+                        self.assertEqual(len(x["reverse_slope"]), len(x["reverse"]))
+
+    def test_estimate_bias(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main estimate-bias \
+                        --bam /input/test.bam --assembly hg38-chrM --offline --samples 20 --window 500 --output-prefix /output/bias
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                with open("{d}/bias_F.txt".format(d = d), 'r') as f:
+                    self.assertEqual(len(f.readlines()), 4 ** 8)
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --aggregate \
+                        --bias-table-f /output/bias_F.txt --bias-table-r /output/bias_R.txt > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    self.assertEqual(len(json.load(f)["all"]["forward"]), 1000)
+
+    def test_rejected_regions(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                with open("{d}/test.bed".format(d = d), 'w') as o:
+                    o.write("chrM\t1000\t1100\tA\t+\nchrM\t10\t20\tB\t+\nchrZ\t1000\t1100\tC\t-\n")
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {d}:/output --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /output/test.bed --bam /input/test.bam --assembly hg38-chrM --rejected-regions /output/rejected.bed > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                with open("{d}/test.json".format(d = d), 'r') as f:
+                    self.assertEqual([ x["name"] for x in json.load(f) ], [ "A" ])
+                with open("{d}/rejected.bed".format(d = d), 'r') as f:
+                    self.assertEqual([ (x.split()[3], x.split()[6]) for x in f ], [ ("B", "before_chromosome_start"), ("C", "contig_missing_from_bam") ])
+
     def test_occurrences_extras(self):
 
         with tempfile.TemporaryDirectory() as g:
@@ -203,3 +419,115 @@ class TestApp(unittest.TestCase):
                     self.assertEqual(len([ x for x in f ]), 1)
                 with open("{d}/test.tsv".format(d = d), 'r') as f:
                     self.assertEqual(len(f.readline().strip().split()), 3)               
+
+    def test_occurrences_npz(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 \
+                        --output-format npz --output-file /output/test.npz
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.npz".format(d = d))
+                with zipfile.ZipFile("{d}/test.npz".format(d = d), 'r') as z:
+                    self.assertEqual(
+                        sorted(z.namelist()),
+                        sorted([ "forward.npy", "reverse.npy", "chromosome.npy", "start.npy", "end.npy", "name.npy", "strand.npy" ])
+                    )
+                    self.assertEqual(z.getinfo("forward.npy").compress_type, zipfile.ZIP_STORED)
+                    self.assertEqual(z.getinfo("forward.npy").file_size > 9 * 1000 * 4, True)
+
+    def test_occurrences_jsonl(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 \
+                        --output-format jsonl > {d}/test.jsonl
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.jsonl".format(d = d))
+                with open("{d}/test.jsonl".format(d = d), 'r') as f:
+                    j = [ json.loads(x) for x in f ]
+                    self.assertEqual(len(j), 9)
+                    self.assertEqual(len(j[0]["forward"]), 1000)
+
+    def test_occurrences_region_tsv(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 \
+                        --output-format tsv > {d}/test.tsv
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.tsv".format(d = d))
+                with open("{d}/test.tsv".format(d = d), 'r') as f:
+                    lines = [ x.strip().split('\t') for x in f ]
+                    self.assertEqual(len(lines), 9)
+                    self.assertEqual(len(lines[0]), 7)
+                    self.assertEqual(len(lines[0][5].split(',')), 1000)
+
+    def test_cut_site_cache(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 > {d}/test.json && \
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.occ.bed --bam /input/test.bam --assembly hg38-chrM --occurrence-threshold 1.0 --cut-site-cache > {d}/test.cached.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.cached.json".format(d = d))
+                with open("{d}/test.json".format(d = d), 'r') as f, open("{d}/test.cached.json".format(d = d), 'r') as c:
+                    j = json.load(c)
+                    self.assertEqual(len(j), 9)
+                    self.assertEqual(j, json.load(f))
+
+    def test_precompute_tracks(self):
+
+        with tempfile.TemporaryDirectory() as g:
+
+            if os.system("tar zfx {GENOME} --directory {g}".format(GENOME = GENOME, g = g)) != 0:
+                raise Exception("unable to extract required genome files")
+
+            with tempfile.TemporaryDirectory() as d:
+                if os.system("""
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main \
+                        precompute --bam /input/test.bam --assembly hg38-chrM --output-prefix /output/test && \
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM --volume {d}:/output test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM --tracks /output/test > {d}/test.tracks.json && \
+                    docker run --env RGTDATA=/rgtdata --volume {inputs} --volume {g}:/rgtdata/hg38-chrM test python3 -m app.main \
+                        --bed /input/test.bed --bam /input/test.bam --assembly hg38-chrM > {d}/test.json
+                """.format(inputs = INPUTS, d = d, g = g)) != 0:
+                    raise Exception("unable to run tests")
+                self.assertFileExists("{d}/test.forward.bw".format(d = d))
+                self.assertFileExists("{d}/test.reverse.bw".format(d = d))
+                with open("{d}/test.json".format(d = d), 'r') as f, open("{d}/test.tracks.json".format(d = d), 'r') as t:
+                    expected = json.load(f); j = json.load(t)
+                    self.assertEqual(len(j), 7)
+                    for x, y in zip(expected, j):
+                        self.assertEqual(len(x["forward"]), len(y["forward"]))
+                        for a, b in zip(x["forward"] + x["reverse"], y["forward"] + y["reverse"]):
+                            self.assertAlmostEqual(a, b, places = 6)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+from unittest import mock
+
+from ..benchmark import benchmark
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_benchmark(self):
+        with tempfile.TemporaryDirectory() as d:
+            benchmark.main([ "--regions", "50", "--workdir", d, "--output-file", os.path.join(d, "benchmark.json") ])
+            with open(os.path.join(d, "benchmark.json"), 'r') as f:
+                j = json.load(f)
+        self.assertEqual([ x for x in [ "generate", "filter", "footprint", "aggregate", "write_json" ] if x not in j["phases"] ], [])
+        self.assertEqual(j["phases"]["generate"]["regions"], 50)
+        self.assertEqual(j["phases"]["footprint"]["regions"] > 0, True)
+        self.assertEqual(j["phases"]["aggregate"]["regions"], j["phases"]["footprint"]["regions"])
+
+    def test_benchmark_without_h5py(self):
+        # a None entry in sys.modules makes "import h5py" raise ImportError; the hdf5 phase is skipped with a warning
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(sys.modules, { "h5py": None }):
+            benchmark.main([ "--regions", "20", "--workdir", d, "--output-file", os.path.join(d, "benchmark.json") ])
+            with open(os.path.join(d, "benchmark.json"), 'r') as f:
+                j = json.load(f)
+        self.assertEqual("write_npz" in j["phases"], True)
+        self.assertEqual("write_hdf5" in j["phases"], False)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import itertools
+import unittest
+
+from pysam import Fastafile, Samfile
+
+from ..benchmark.synthetic import writeGenome, writeBam
+from ..footprint.estimate import estimateBias, sampleRegions, writeTable
+from ..footprint.kmers import revcomp
+
+def naiveBias(bam: str, genome: str, regions, k: int, forward_shift: int = 4, reverse_shift: int = -4):
+    # rgt's estimate_bias_kmer with dicts, one read at a time
+    obs = [ {}, {} ]; exp = [ {}, {} ]; reads = [ 0, 0 ]; kmers = 0
+    with Samfile(bam, "rb") as b, Fastafile(genome) as f:
+        for chromosome, start, end in regions:
+            previous = -1; duplicates = 0
+            for r in b.fetch(chromosome, start, end):
+                p1 = (r.reference_end + reverse_shift + 1 if r.is_reverse else r.reference_start + forward_shift - 1) - k // 2
+                if p1 == previous:
+                    duplicates += 1
+                else:
+                    previous = p1; duplicates = 0
+                if duplicates > 100 or p1 < 0: continue
+                s = f.fetch(chromosome, p1, p1 + k).upper()
+                if r.is_reverse: s = revcomp(s)
+                reads[r.is_reverse] += 1
+                obs[r.is_reverse][s] = obs[r.is_reverse].get(s, 0) + 1
+            s = f.fetch(chromosome, start, end).upper()
+            rs = revcomp(s)
+            for i in range(0, len(s) - k):
+                kmers += 1
+                exp[0][s[i:i + k]] = exp[0].get(s[i:i + k], 0) + 1
+                exp[1][rs[i:i + k]] = exp[1].get(rs[i:i + k], 0) + 1
+    return [
+        [ round(float((obs[x].get(kmer, 0) + 1.0) / reads[x]) / float((exp[x].get(kmer, 0) + 1.0) / kmers), 6) for kmer in map(''.join, itertools.product("ACGT", repeat = k)) ]
+        for x in range(2)
+    ]
+
+class TestEstimate(unittest.TestCase):
+
+    def test_sample_regions(self):
+        regions = sampleRegions({ "chr1": 10500, "chr2": 5000, "chr3": 100 }, 12, 1000)
+        self.assertEqual(len(regions), 12)
+        self.assertEqual(regions, sorted(regions, key = lambda x: (int(x[0][3:]), x[1])))
+        self.assertEqual(len(set(regions)), 12)
+        self.assertEqual(all([ x[2] - x[1] == 1000 and x[2] <= { "chr1": 10500, "chr2": 5000 }[x[0]] for x in regions ]), True)
+
+    def test_estimate(self):
+        with tempfile.TemporaryDirectory() as d:
+            sizes = { "chr1": 20000, "chr2": 8000 }
+            genome = os.path.join(d, "genome.fa")
+            writeGenome(genome, sizes)
+            bam = os.path.join(d, "reads.bam")
+            writeBam(bam, sizes, [ ("chr1", 5000), ("chr1", 12000), ("chr2", 100) ], 400)
+            regions = [ ("chr1", 0, 6000), ("chr1", 10000, 20000), ("chr2", 0, 8000) ]
+            for k in [ 4, 6 ]:
+                self.assertEqual(estimateBias(bam, genome, regions, k), naiveBias(bam, genome, regions, k))
+            forward, _ = estimateBias(bam, genome, regions, 2)
+            writeTable(os.path.join(d, "table.txt"), forward, 2)
+            with open(os.path.join(d, "table.txt"), 'r') as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 16)
+            self.assertEqual(lines[1].split('\t')[0], "AC")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from ..regions.filter import FilteredRegions, fastaChromosomes, capOccurrences
+
+RESOURCES = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources" )
+
+class TestFilter(unittest.TestCase):
+
+    def test_fai(self):
+        with tempfile.TemporaryDirectory() as d:
+            # an empty FASTA next to the index shows that names come from the index alone
+            shutil.copy(os.path.join(RESOURCES, "test.fa.fai"), os.path.join(d, "test.fa.fai"))
+            open(os.path.join(d, "test.fa"), 'w').close()
+            self.assertEqual(fastaChromosomes(os.path.join(d, "test.fa")), set([ "chrM" ]))
+
+    def test_builds_fai(self):
+        with tempfile.TemporaryDirectory() as d:
+            shutil.copy(os.path.join(RESOURCES, "test.fa"), os.path.join(d, "test.fa"))
+            self.assertEqual(fastaChromosomes(os.path.join(d, "test.fa")), set([ "chrM" ]))
+            self.assertEqual(os.path.exists(os.path.join(d, "test.fa.fai")), True)
+
+    def test_filter(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "chrom.sizes"), 'w') as o:
+                o.write("chrM\t16569\nchr2\t242193529\n")
+            with FilteredRegions(
+                os.path.join(RESOURCES, "test.occ.extras.bed"), 1.0, os.path.join(RESOURCES, "test.fa"), os.path.join(d, "chrom.sizes")
+            ) as b:
+                self.assertEqual(list(b), [ ("chrM", 1847, 1862, "WTTTCTCTCWGTGYA", "-") ])
+
+    def test_filter_gzip(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "chrom.sizes"), 'w') as o:
+                o.write("chrM\t16569\n")
+            with open(os.path.join(RESOURCES, "test.occ.bed"), 'rb') as i, gzip.open(os.path.join(d, "test.occ.bed.gz"), 'wb') as o:
+                shutil.copyfileobj(i, o)
+            plain = FilteredRegions(os.path.join(RESOURCES, "test.occ.bed"), 1e-5, os.path.join(RESOURCES, "test.fa"), os.path.join(d, "chrom.sizes"))
+            compressed = FilteredRegions(os.path.join(d, "test.occ.bed.gz"), 1e-5, os.path.join(RESOURCES, "test.fa"), os.path.join(d, "chrom.sizes"))
+            self.assertEqual(list(compressed), list(plain))
+            self.assertEqual(len(list(plain)) > 0, True)
+
+    def test_cap_best(self):
+        occurrences = [ (q, ("chrM", i, i + 10, m, '+')) for i, (q, m) in enumerate([ (0.3, "A"), (0.1, "A"), (0.2, "B"), (0.1, "A"), (0.05, "A") ]) ]
+        self.assertEqual([ x[1] for x in capOccurrences(occurrences, 2, "best") ], [ 1, 2, 4 ])
+        self.assertEqual([ x[1] for x in capOccurrences(occurrences, 3, "best") ], [ 1, 2, 3, 4 ])
+
+    def test_cap_reservoir(self):
+        occurrences = [ (0.1, ("chrM", i, i + 10, "AB"[i % 2], '+')) for i in range(1000) ]
+        kept = list(capOccurrences(occurrences, 50, "reservoir", 7))
+        self.assertEqual(len(kept), 100)
+        self.assertEqual(len([ x for x in kept if x[3] == "A" ]), 50)
+        self.assertEqual([ x[1] for x in kept ], sorted([ x[1] for x in kept ]))
+        self.assertEqual(kept, list(capOccurrences(occurrences, 50, "reservoir", 7)))
+        self.assertNotEqual(kept, list(capOccurrences(occurrences, 50, "reservoir", 8)))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+import numpy
+
+from multiprocessing import Pool
+
+from ..footprint.footprint import boundedMap, expandRegion, uniqueWindows, fanOut, orientSignal, windowCause, skippedSignals, regionDicts
+
+class TestFootprint(unittest.TestCase):
+
+    def test_unique_windows(self):
+        regions = [
+            expandRegion("chrM", 100, 110, "A", 50, '+'), expandRegion("chrM", 100, 110, "B", 50, '-'),
+            expandRegion("chrM", 100, 111, "A", 50, '+'), expandRegion("chrM", 100, 111, "A", 50, '-')
+        ]
+        windows, index = uniqueWindows(regions)
+        self.assertEqual(windows, [ ("chrM", 55, 155), ("chrM", 56, 156) ])
+        self.assertEqual(index, [ 0, 0, 0, 1 ])
+
+    def test_fan_out(self):
+        regions = [ ("chrM", 0, 3, "A", '+'), ("chrM", 5, 8, "B", '+'), ("chrM", 0, 3, "B", '-'), ("chrM", 5, 8, "C", '.') ]
+        windows, index = uniqueWindows(regions)
+        computed = []
+        def signals():
+            for x in [ (numpy.array([ 1.0, 2.0, 3.0 ], dtype = numpy.float32), numpy.array([ 4.0, 5.0, 6.0 ], dtype = numpy.float32)), (None, "contig_missing_from_bam") ]:
+                computed.append(x)
+                yield x
+        results = list(fanOut(regions, index, signals()))
+        self.assertEqual(len(computed), 2)
+        self.assertEqual([ tuple(x.tolist() if x is not None and not isinstance(x, str) else x for x in y) for y in results ], [
+            ([ 1.0, 2.0, 3.0 ], [ 4.0, 5.0, 6.0 ]), (None, "contig_missing_from_bam"),
+            ([ 6.0, 5.0, 4.0 ], [ 3.0, 2.0, 1.0 ]), (None, "contig_missing_from_bam")
+        ])
+        # the - strand reads the shared window through views
+        self.assertIs(results[2][0].base, computed[0][1])
+
+    def test_orient_signal(self):
+        forward, reverse = numpy.array([ 1.0, 2.0 ], dtype = numpy.float32), numpy.array([ 3.0, 4.0 ], dtype = numpy.float32)
+        self.assertEqual([ x.tolist() for x in orientSignal((forward, reverse), '-') ], [ [ 4.0, 3.0 ], [ 2.0, 1.0 ] ])
+        self.assertIs(orientSignal((forward, reverse), '+')[0], forward)
+        self.assertEqual(orientSignal((None, "error:ValueError"), '-'), (None, "error:ValueError"))
+
+    def test_window_cause(self):
+        references, lengths = { "chrM" }, { "chrM": 16569, "chr1": 248956422 }
+        self.assertEqual(windowCause(("chrM", -10, 990), references, lengths), "before_chromosome_start")
+        self.assertEqual(windowCause(("chr1", 1000, 2000), references, lengths), "contig_missing_from_bam")
+        self.assertEqual(windowCause(("chrM", 1000, 2000), { "chrM" }, {}), "contig_missing_from_genome")
+        self.assertEqual(windowCause(("chrM", 20000, 21000), references, lengths), "past_chromosome_end")
+        self.assertIsNone(windowCause(("chrM", 1000, 2000), references, lengths))
+        self.assertIsNone(windowCause(("chrM", 0, 1000), { "chrM" }, {}))
+        self.assertEqual(windowCause(("chrM", 27, 1027), references, lengths), "before_chromosome_start")
+        self.assertIsNone(windowCause(("chrM", 29, 1029), references, lengths))
+
+    def test_window_cause_chromosome_end(self):
+        # the bias correction of a window that ends past the chromosome end runs on the truncated sequence, which
+        # fails once fewer than BIAS_WINDOW k-mers are left
+        references, lengths = { "chrM" }, { "chrM": 16569 }
+        self.assertEqual(windowCause(("chrM", 16550, 17550), references, lengths), "past_chromosome_end")
+        self.assertEqual(windowCause(("chrM", 16545, 16595), references, lengths), "past_chromosome_end")
+        self.assertIsNone(windowCause(("chrM", 16540, 16600), references, lengths))
+        self.assertIsNone(windowCause(("chrM", 16000, 17000), references, lengths))
+
+    def test_bounded_map(self):
+        # a consumer slower than the pool never has more than limit jobs submitted ahead of it, so the results
+        # held in the parent do not grow with the number of jobs
+        pulled = []
+        def jobs():
+            for i in range(50):
+                pulled.append(i)
+                yield -i
+        with Pool(2) as pool:
+            for i, x in enumerate(boundedMap(pool, abs, jobs(), 3)):
+                self.assertEqual(x, i)
+                self.assertLessEqual(len(pulled) - (i + 1), 3)
+        self.assertEqual(len(pulled), 50)
+
+    def test_skipped_signals(self):
+        signals = [ ([ 1.0 ], [ 2.0 ]), ([ 3.0 ], [ 4.0 ]) ]
+        self.assertEqual(list(skippedSignals([ None, "past_chromosome_end", None ], signals)), [
+            ([ 1.0 ], [ 2.0 ]), (None, "past_chromosome_end"), ([ 3.0 ], [ 4.0 ])
+        ])
+
+    def test_rejected_regions(self):
+        regions = [ ("chrM", 0, 3, "A", '+'), ("chr1", 5, 8, None, '-') ]
+        rejected = io.StringIO()
+        results = list(regionDicts(regions, [ (numpy.ones(1, dtype = numpy.float32), numpy.ones(1, dtype = numpy.float32)), (None, "contig_missing_from_bam") ], rejected))
+        self.assertEqual([ x["name"] for x in results ], [ "A" ])
+        self.assertEqual(rejected.getvalue(), "chr1\t5\t8\t.\t0\t-\tcontig_missing_from_bam\n")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..genome.genome import prepareGenome, isPrepared, readSizes
+
+RESOURCES = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources" )
+GENOME = os.path.join(RESOURCES, "hg38-chrM.tar.gz")
+CONFIG = "[test]\ngenome: test/genome_test.fa\nchromosome_sizes: test/chrom.sizes.test\n"
+
+class TestGenome(unittest.TestCase):
+
+    def root(self, d: str, config: str = CONFIG):
+        with open(os.path.join(d, "data.config"), 'w') as o:
+            o.write(config)
+        return d
+
+    def test_import_tarball(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.root(d, CONFIG.replace("test", "hg38-chrM"))
+            self.assertEqual(prepareGenome("hg38-chrM", offline = True, root = d), False)
+            self.assertEqual(prepareGenome("hg38-chrM", GENOME, root = d), True)
+            genome = os.path.join(d, "hg38-chrM", "genome_hg38-chrM.fa")
+            self.assertEqual(isPrepared(genome, os.path.join(d, "hg38-chrM", "chrom.sizes.hg38-chrM")), True)
+            # prepared data is used as is, without a tarball or network access
+            self.assertEqual(prepareGenome("hg38-chrM", offline = True, root = d), True)
+
+    def test_builds_index_and_sizes(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.root(d)
+            os.mkdir(os.path.join(d, "test"))
+            shutil.copy(os.path.join(RESOURCES, "test.fa"), os.path.join(d, "test", "genome_test.fa"))
+            self.assertEqual(prepareGenome("test", offline = True, root = d), True)
+            self.assertEqual(os.path.exists(os.path.join(d, "test", "genome_test.fa.fai")), True)
+            self.assertEqual(readSizes(os.path.join(d, "test", "chrom.sizes.test")), { "chrM": 16569 })
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.root(d)
+            os.mkdir(os.path.join(d, "test"))
+            shutil.copy(os.path.join(RESOURCES, "test.fa"), os.path.join(d, "test", "genome_test.fa"))
+            with open(os.path.join(d, "test", "chrom.sizes.test"), 'w') as o:
+                o.write("chrM\t100\n")
+            self.assertEqual(prepareGenome("test", offline = True, root = d), False)
+            # an index that points past the end of the FASTA, as after a truncated download
+            os.remove(os.path.join(d, "test", "chrom.sizes.test"))
+            with open(os.path.join(d, "test", "genome_test.fa"), 'r+') as f:
+                f.truncate(1000)
+            shutil.copy(os.path.join(RESOURCES, "test.fa.fai"), os.path.join(d, "test", "genome_test.fa.fai"))
+            self.assertEqual(prepareGenome("test", offline = True, root = d), False)
+
+    def test_malformed_fasta(self):
+        # uneven line lengths cannot be indexed
+        with tempfile.TemporaryDirectory() as d:
+            self.root(d)
+            os.mkdir(os.path.join(d, "test"))
+            with open(os.path.join(d, "test", "genome_test.fa"), 'w') as o:
+                o.write(">chrM\nACGTACGTAC\nACG\nACGTACGTAC\nACGT\n")
+            self.assertEqual(prepareGenome("test", offline = True, root = d), False)
+
+    def test_unknown_assembly(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.assertEqual(prepareGenome("hg38", offline = True, root = self.root(d)), False)
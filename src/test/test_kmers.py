@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import pickle
+import random
+import tempfile
+import itertools
+import unittest
+
+from ..footprint.kmers import KmerBias, DenseTable, encode, kmerCodes, loadTable, loadCachedTables
+
+def table(k: int, seed: int, fraction: float = 1.0):
+    r = random.Random(seed)
+    kmers = [ ''.join(x) for x in itertools.product("ACGT", repeat = k) ]
+    return { x: r.uniform(0.1, 10) for x in kmers if r.random() < fraction }
+
+class TestKmers(unittest.TestCase):
+
+    def assertIdentical(self, bias: KmerBias, sequence: str, rsequence: str):
+        for x, y in zip(bias(sequence, rsequence), bias.dictLookup(sequence, rsequence)):
+            self.assertEqual(x.tolist(), y.tolist())
+
+    def test_codes(self):
+        index, invalid = kmerCodes(encode("ACGTNA"), 2)
+        self.assertEqual(index.tolist()[:3], [ 1, 6, 11 ])
+        self.assertEqual(invalid.tolist(), [ False, False, False, True, True ])
+        index, invalid = kmerCodes(encode("AACG"), 2, reverse = True)
+        self.assertEqual(index.tolist(), [ 15, 11, 6 ])
+
+    def test_identical(self):
+        r = random.Random(0)
+        for k, fraction in [ (6, 1.0), (8, 1.0), (5, 1.0), (6, 0.7) ]:
+            bias = KmerBias([ table(k, 1, fraction), table(k, 2, fraction) ])
+            self.assertEqual(bias.forward is not None, True)
+            for length in [ 0, 1, k - 1, k, k + 1, 60, 1100 ]:
+                sequence = ''.join(r.choice("ACGTACGTACGTN") for _ in range(length + 1))
+                self.assertIdentical(bias, sequence[:-1], sequence[1:])
+                # sequences clipped at the end of a chromosome
+                self.assertIdentical(bias, sequence[:-1], sequence[1:-1])
+                self.assertIdentical(bias, sequence[:-2], sequence[1:-2])
+
+    def test_unexpected_bases(self):
+        bias = KmerBias([ table(6, 1), table(6, 2) ])
+        self.assertIdentical(bias, "ACGTRYACGTACGTACGT", "CGTACGTACGTACGTACG")
+        with self.assertRaises(KeyError):
+            bias.dictLookup("ACGTACGTACGTACGTAC", "CGTRYGTACGTACGTACG")
+        with self.assertRaises(KeyError):
+            bias("ACGTACGTACGTACGTAC", "CGTRYGTACGTACGTACG")
+
+    def test_sparse_table(self):
+        bias = KmerBias([ dict(table(6, 1), NNNNNN = 2.0), table(6, 2) ])
+        self.assertEqual(bias.forward, None)
+        sequence = "ACGTNNNNNNACGTACGTACGT"
+        self.assertEqual(bias(sequence[:-1], sequence[1:])[0].tolist(), bias.dictLookup(sequence[:-1], sequence[1:])[0].tolist())
+
+    def test_cached_tables(self):
+        def write(path, t):
+            with open(path, 'w') as o:
+                for x, y in t.items(): o.write("%s\t%f\n" % (x, y))
+        with tempfile.TemporaryDirectory() as d:
+            paths = [ os.path.join(d, "F.txt"), os.path.join(d, "R.txt") ]
+            write(paths[0], table(6, 1, 0.7)); write(paths[1], table(6, 2))
+            expected = KmerBias(loadTable(*paths))
+            for _ in range(2):
+                tables = loadCachedTables(*paths)
+                self.assertIsInstance(tables[0], DenseTable)
+                self.assertEqual(len(glob.glob(os.path.join(d, "*.npy"))), 2)
+                bias = KmerBias(pickle.loads(pickle.dumps(tables)))
+                self.assertEqual(bias.forward.tolist(), expected.forward.tolist())
+                self.assertEqual(bias.reverse.tolist(), expected.reverse.tolist())
+
+            # a changed table replaces its cache
+            write(paths[0], table(6, 3))
+            self.assertEqual(KmerBias(loadCachedTables(*paths)).forward.tolist(), KmerBias(loadTable(*paths)).forward.tolist())
+            self.assertEqual(len(glob.glob(os.path.join(d, "*.npy"))), 2)
+
+            # tables that cannot be indexed densely are loaded as dicts
+            write(paths[0], dict(table(6, 1), NNNNNN = 2.0))
+            self.assertEqual(loadCachedTables(*paths), loadTable(*paths))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from ..metrics.metrics import Metrics
+
+class TestMetrics(unittest.TestCase):
+
+    def test_disabled(self):
+        m = Metrics()
+        with m.phase("a"): pass
+        m.count("b")
+        self.assertEqual(list(m.timed("c", [ 1, 2 ])), [ 1, 2 ])
+        self.assertEqual(m.report(), { "phases": {}, "counts": {} })
+
+    def test_enabled(self):
+        m = Metrics()
+        m.enable()
+        with m.phase("a"): pass
+        m.count("b", 2)
+        self.assertEqual(list(m.timed("c", [ 1, 2 ])), [ 1, 2 ])
+        self.assertEqual(sorted(m.report()["phases"].keys()), [ "a", "c" ])
+        self.assertEqual(m.report()["counts"], { "b": 2 })
+
+    def test_drain_merge(self):
+        worker, parent = Metrics(), Metrics()
+        worker.enable(); parent.enable()
+        worker.count("reads", 3); parent.count("reads", 1)
+        parent.merge(worker.drain())
+        parent.merge(worker.drain())
+        self.assertEqual(parent.report()["counts"], { "reads": 4 })
+        self.assertEqual(worker.report()["counts"], {})
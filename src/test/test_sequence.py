@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import unittest
+
+from pysam import Fastafile
+
+from ..footprint.sequence import SequenceCache
+
+FASTA = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources", "test.fa" )
+
+class TestSequence(unittest.TestCase):
+
+    def fetch(self, f, *args):
+        try:
+            return f(*args)
+        except (ValueError, KeyError) as e:
+            return type(e)
+
+    def test_matches_fasta(self):
+        with Fastafile(FASTA) as fasta:
+            cache = SequenceCache(fasta, block_size = 1000, max_blocks = 3)
+            chromosome = fasta.references[0]
+            length = fasta.get_reference_length(chromosome)
+            r = random.Random(0)
+            for _ in range(1000):
+                start = r.randint(-5, length + 500)
+                end = start + r.randint(-3, 2500)
+                self.assertEqual(
+                    self.fetch(cache, chromosome, start, end),
+                    self.fetch(lambda *x: str(fasta.fetch(*x)).upper(), chromosome, start, end)
+                )
+            self.assertEqual(len(cache.blocks) <= 3, True)
+            self.assertEqual(self.fetch(cache, "missing", 0, 10), KeyError)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import tempfile
+import unittest
+import numpy
+
+from pysam import Fastafile, Samfile
+
+from ..footprint.constants import FORWARD_SHIFT, REVERSE_SHIFT
+from ..footprint.estimate import writeTable
+from ..footprint.kmers import KmerBias, loadCachedTables
+from ..footprint.sequence import SequenceCache
+from ..footprint.signal import atacSignal, cutSites, CutSiteBlocks, slopeSignals, scoreAtPercentile, honNorm
+
+BAM = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources", "test.bam" )
+FASTA = os.path.join( os.path.dirname(os.path.realpath(__file__)), "resources", "test.fa" )
+
+class TestSignal(unittest.TestCase):
+
+    def test_cut_site_blocks(self):
+        with Samfile(BAM, "rb") as bam:
+            blocks = CutSiteBlocks(bam, block_size = 1000, max_blocks = 3)
+            r = random.Random(0)
+            for _ in range(200):
+                start = r.randint(0, 17000)
+                end = start + r.randint(1, 2500)
+                expected = cutSites(bam, "chrM", start, end)
+                observed = blocks("chrM", start, end)
+                self.assertEqual(observed[0].tolist(), expected[0].tolist())
+                self.assertEqual(observed[1].tolist(), expected[1].tolist())
+            self.assertEqual(len(blocks.blocks), 3)
+
+    def test_slope_signals(self):
+        # rgt's slope stage, one profile at a time: convolution with the reversed Savitzky-Golay derivative
+        # coefficients trimmed to the input length, then hon normalization
+        r = numpy.random.default_rng(0)
+        forward, reverse = r.random((5, 200)), r.random((5, 200))
+        forward[:, :20] = 0
+        b = numpy.array([ [ k ** i for i in range(3) ] for k in range(-4, 5) ])
+        coefficients = numpy.linalg.pinv(b)[1][::-1]
+        slope = lambda x: numpy.convolve(x, coefficients)[4:-4]
+        f, s = slopeSignals(forward, reverse, 9)
+        for i in range(5):
+            x, y = slope(forward[i]), slope(reverse[i])
+            x = honNorm(x, scoreAtPercentile(x, 98), x.std())
+            y = honNorm(y, scoreAtPercentile(y, 98), x.std())
+            self.assertTrue(numpy.allclose(f[i], x, rtol = 0, atol = 1e-12))
+            self.assertTrue(numpy.allclose(s[i], y, rtol = 0, atol = 1e-12))
+
+    def test_atac_signal_rgt(self):
+        # the NumPy path as footprint() runs it, with cut sites from the block cache, sequence from the block cache
+        # and dense k-mer tables from their binary caches, against rgt's get_signal_atac on the same random tables;
+        # windows cover both chromosome ends, including ones that run past chrM's 16569 bases
+        from rgt.HINT.signalProcessing import GenomicSignal
+        from rgt.HINT.biasTable import BiasTable
+        r = numpy.random.default_rng(0)
+        windows = [ (0, 1000), (20, 1020), (28, 1028), (29, 1029), (500, 1500), (4000, 6000), (15569, 16569), (16000, 17000), (16500, 16600), (16540, 16600) ]
+        with tempfile.TemporaryDirectory() as d, Samfile(BAM, "rb") as bam, Fastafile(FASTA) as fasta:
+            paths = [ os.path.join(d, "bias_F.txt"), os.path.join(d, "bias_R.txt") ]
+            for path in paths:
+                writeTable(path, (0.5 + r.random(4 ** 6)).tolist(), 6)
+            expected = BiasTable().load_table(table_file_name_F = paths[0], table_file_name_R = paths[1])
+            signal = GenomicSignal(BAM)
+            signal.load_sg_coefs(9)
+            kmer_bias = KmerBias(loadCachedTables(*paths))
+            counts, sequence = CutSiteBlocks(bam, block_size = 1000), SequenceCache(fasta, block_size = 1000)
+            for start, end in windows:
+                for per_norm in (98, 90):
+                    f, _, rv, _ = signal.get_signal_atac("chrM", start, end, 0, 0, FORWARD_SHIFT, REVERSE_SHIFT, 150, per_norm, 98, expected, FASTA)
+                    forward, reverse = atacSignal(counts, sequence, "chrM", start, end, kmer_bias, per_norm)
+                    self.assertEqual(len(forward), len(f))
+                    self.assertTrue(numpy.allclose(forward, f) and numpy.allclose(reverse, rv), (start, end, per_norm))
+
+    def test_slope_signals_rgt(self):
+        # slopes of rgt's normalized profiles against rgt's own slopes, including windows at the start of chrM with
+        # unit bias tables, where runs of zero counts leave slopes rgt's convolution rounds to tiny non-zero values
+        from rgt.HINT.signalProcessing import GenomicSignal
+        from rgt.HINT.biasTable import BiasTable
+        r = numpy.random.default_rng(1)
+        windows = [ (0, 1000), (10, 1010), (25, 1025), (500, 1500), (15569, 16569) ]
+        with tempfile.TemporaryDirectory() as d:
+            for name, values in (("unit", numpy.ones(4 ** 6)), ("random", 0.5 + r.random(4 ** 6))):
+                paths = [ os.path.join(d, name + "_F.txt"), os.path.join(d, name + "_R.txt") ]
+                for path in paths:
+                    writeTable(path, values.tolist(), 6)
+                table = BiasTable().load_table(table_file_name_F = paths[0], table_file_name_R = paths[1])
+                signal = GenomicSignal(BAM)
+                signal.load_sg_coefs(9)
+                for start, end in windows:
+                    for per_norm in (98, 90):
+                        f, fs, rv, rs = signal.get_signal_atac("chrM", start, end, 0, 0, FORWARD_SHIFT, REVERSE_SHIFT, 150, per_norm, 98, table, FASTA)
+                        x, y = slopeSignals(numpy.array([ f ]), numpy.array([ rv ]), 9, per_norm)
+                        self.assertTrue(numpy.allclose(x[0], fs, rtol = 0, atol = 1e-12), (name, start, end, per_norm))
+                        self.assertTrue(numpy.allclose(y[0], rs, rtol = 0, atol = 1e-12), (name, start, end, per_norm))